@@ -0,0 +1,62 @@
+"""
+Benchmark writing zip files with `grawlix.output.zip_writer.ZipWriter`
+compared to `zipfile.ZipFile` from the standard library
+
+    python -m benchmarks.compression [--chapters N] [--chapter-size BYTES]
+"""
+from grawlix.output.zip_writer import ZipWriter
+
+from zipfile import ZipFile, ZIP_DEFLATED
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+WORDS = "the a of and to in is was he for it with as his on be at by i this had not are but from or have an they which one you were her all she there would their".split()
+
+
+def chapter(index: int, size: int) -> bytes:
+    """Xhtml chapter with text that compresses like real prose"""
+    rng = random.Random(index)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return f"<html><body><p>{' '.join(words)}</p></body></html>".encode()
+
+
+async def write_zip(location: str, chapters: list[tuple[str, bytes]]) -> None:
+    async with ZipWriter(location) as writer:
+        for name, content in chapters:
+            await writer.write(name, content)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "Benchmark zip writers")
+    parser.add_argument("--chapters", type = int, default = 2000)
+    parser.add_argument("--chapter-size", type = int, default = 50_000)
+    args = parser.parse_args()
+    chapters = [(f"EPUB/chapter{i}.xhtml", chapter(i, args.chapter_size)) for i in range(args.chapters)]
+    total = sum(len(content) for _, content in chapters)
+    print(f"{args.chapters} chapters, {total / 1_000_000:.1f} MB, {os.cpu_count()} cpus")
+    with tempfile.TemporaryDirectory() as directory:
+        location = os.path.join(directory, "zipfile.zip")
+        start = time.perf_counter()
+        with ZipFile(location, "w", ZIP_DEFLATED) as zip:
+            for name, content in chapters:
+                zip.writestr(name, content)
+        print(f"  zipfile    {time.perf_counter() - start:7.2f} s {os.path.getsize(location) / 1_000_000:7.1f} MB")
+        location = os.path.join(directory, "zip_writer.zip")
+        start = time.perf_counter()
+        asyncio.run(write_zip(location, chapters))
+        print(f"  ZipWriter  {time.perf_counter() - start:7.2f} s {os.path.getsize(location) / 1_000_000:7.1f} MB")
+        with ZipFile(location) as zip:
+            assert zip.testzip() is None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+End-to-end benchmarks of `grawlix.output.download_book` against a local server
+
+Content is served from the benchmark process while every scenario is
+downloaded in a separate process, so peak memory usage and cpu time only
+include grawlix itself. Run from the root of the repository:
+
+    python -m benchmarks.download [--scale N] [scenario ...]
+"""
+from grawlix.book import Book, Metadata, ImageList, OnlineFile, EpubInParts, HtmlFile, HtmlFiles, SingleFile
+from grawlix.encryption import AESEncryption, AESCTREncryption, XOrEncryption
+from grawlix.sources.dcuniverseinfinite import DcUniverseInfiniteEncryption
+from grawlix.output import download_book
+from .server import ContentServer
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+from typing import Callable
+from zipfile import ZipFile, ZIP_DEFLATED
+import argparse
+import asyncio
+import io
+import json
+import os
+import pickle
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+KEY = bytes(range(16))
+IV = bytes(range(16, 32))
+PAGE_SIZE = 400_000
+
+
+def random_bytes(size: int, seed: int) -> bytes:
+    """Incompressible content standing in for images"""
+    return random.Random(seed).randbytes(size)
+
+
+def text(size: int, seed: int) -> str:
+    """Compressible text standing in for chapters"""
+    rng = random.Random(seed)
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "grawlix", "comic", "chapter", "page"]
+    result: list[str] = []
+    length = 0
+    while length < size:
+        paragraph = " ".join(rng.choice(words) for _ in range(80))
+        result.append(f"<p>{paragraph}</p>")
+        length += len(paragraph) + 7
+    return "\n".join(result)
+
+
+def xhtml(title: str, body: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml">'
+        f"<head><title>{title}</title></head><body>{body}</body></html>"
+    )
+
+
+def image_list(server: ContentServer, scale: int, encrypt: Callable[[bytes, int], tuple[bytes, object]]) -> Book:
+    """Comic with pages encrypted by `encrypt`"""
+    images = []
+    for index in range(20 * scale):
+        content, encryption = encrypt(random_bytes(PAGE_SIZE, index), index)
+        url = server.add(f"/pages/{index}.jpg", content, "image/jpeg")
+        images.append(OnlineFile(url, "jpg", encryption = encryption))
+    return Book(Metadata("image list"), ImageList(images))
+
+
+def no_encryption(content: bytes, index: int) -> tuple[bytes, object]:
+    return content, None
+
+
+def aes_cbc(content: bytes, index: int) -> tuple[bytes, object]:
+    cipher = AES.new(KEY, AES.MODE_CBC, IV)
+    return cipher.encrypt(pad(content, 16)), AESEncryption(KEY, IV)
+
+
+def aes_ctr(content: bytes, index: int) -> tuple[bytes, object]:
+    nonce, initial_value = bytes(8), bytes(8)
+    cipher = AES.new(key = KEY, mode = AES.MODE_CTR, nonce = nonce, initial_value = initial_value)
+    return cipher.encrypt(content), AESCTREncryption(KEY, nonce, initial_value)
+
+
+def xor(content: bytes, index: int) -> tuple[bytes, object]:
+    encryption = XOrEncryption(KEY)
+    # Xor is its own inverse
+    return encryption.decrypt(content), encryption
+
+
+def dc_universe_infinite(content: bytes, index: int) -> tuple[bytes, object]:
+    encryption = DcUniverseInfiniteEncryption("uuid", index, "job", "format")
+    cipher = AES.new(encryption.key, AES.MODE_CBC, IV)
+    encrypted = len(content).to_bytes(8, "little") + IV + cipher.encrypt(pad(content, 16))
+    return encrypted, encryption
+
+
+def epub_part(files: dict[str, bytes]) -> bytes:
+    """Create an epub part padded to the AES block size with the zip comment"""
+    buffer = io.BytesIO()
+    with ZipFile(buffer, "w", ZIP_DEFLATED) as zipfile:
+        zipfile.writestr("mimetype", "application/epub+zip")
+        for name, content in files.items():
+            zipfile.writestr(name, content)
+        zipfile.writestr("OEBPS/content.opf", "<package/>")
+        # Zip comment length is stored in the end of central directory record
+        # so its size has to be known before closing
+        length = buffer.tell() + sum(46 + len(i.filename) for i in zipfile.infolist()) + 22
+        zipfile.comment = b" " * (-length % 16)
+    return buffer.getvalue()
+
+
+def epub_in_parts(server: ContentServer, scale: int) -> Book:
+    """Nextory style book where every part repeats shared resources"""
+    shared = {
+        "OEBPS/styles/style.css": text(20_000, -1).encode(),
+        "OEBPS/fonts/font.ttf": random_bytes(150_000, -2),
+        "OEBPS/images/cover.jpg": random_bytes(300_000, -3),
+    }
+    part_count = 30 * scale
+    parts = []
+    files_in_toc = {}
+    for index in range(part_count):
+        files = dict(shared)
+        # Parts overlap by containing the neighbouring chapters as well
+        for chapter in (index - 1, index, index + 1):
+            if 0 <= chapter < part_count:
+                files[f"OEBPS/chapter{chapter}.xhtml"] = xhtml(f"Chapter {chapter}", text(40_000, chapter)).encode()
+        files_in_toc[f"chapter{index}.xhtml"] = f"Chapter {index}"
+        cipher = AES.new(KEY, AES.MODE_CBC, IV)
+        url = server.add(f"/parts/{index}.epub", cipher.encrypt(epub_part(files)))
+        parts.append(OnlineFile(url, "epub", encryption = AESEncryption(KEY, IV)))
+    return Book(Metadata("epub in parts"), EpubInParts(parts, files_in_toc))
+
+
+def html_files(server: ContentServer, scale: int) -> Book:
+    """Web novel with large chapters"""
+    chapters = []
+    for index in range(100 * scale):
+        page = f"<html><body><nav>menu</nav><div id=\"storytext\">{text(100_000, index)}</div></body></html>"
+        url = server.add(f"/chapters/{index}", page.encode(), "text/html")
+        chapters.append(HtmlFile(f"Chapter {index}", OnlineFile(url, "html"), { "id": "storytext" }))
+    cover = OnlineFile(server.add("/cover.jpg", random_bytes(PAGE_SIZE, -1), "image/jpeg"), "jpg")
+    return Book(Metadata("html files"), HtmlFiles(chapters, cover))
+
+
+def single_file(server: ContentServer, scale: int) -> Book:
+    """Large encrypted epub"""
+    content, encryption = aes_ctr(random_bytes(50_000_000 * scale, 0), 0)
+    url = server.add("/book.epub", content)
+    return Book(Metadata("single file"), SingleFile(OnlineFile(url, "epub", encryption = encryption)))
+
+
+SCENARIOS: dict[str, Callable[[ContentServer, int], Book]] = {
+    "image-list": lambda server, scale: image_list(server, scale, no_encryption),
+    "image-list-aes-cbc": lambda server, scale: image_list(server, scale, aes_cbc),
+    "image-list-aes-ctr": lambda server, scale: image_list(server, scale, aes_ctr),
+    "image-list-xor": lambda server, scale: image_list(server, scale, xor),
+    "image-list-dcuniverseinfinite": lambda server, scale: image_list(server, scale, dc_universe_infinite),
+    "epub-in-parts": epub_in_parts,
+    "html-files": html_files,
+    "single-file": single_file,
+}
+
+
+def run_scenario(name: str, scale: int) -> dict:
+    """
+    Serve content of scenario from this process and download it in a child
+    process, so measurements only include grawlix itself
+
+    :param name: Name of scenario
+    :param scale: Multiplier for size of scenario
+    :returns: Measurements
+    """
+    with ContentServer() as server:
+        book = SCENARIOS[name](server, scale)
+        process = subprocess.run(
+            [sys.executable, "-m", "benchmarks.download", "--child"],
+            input = pickle.dumps(book),
+            capture_output = True,
+            check = True,
+        )
+        result = json.loads(process.stdout.decode().splitlines()[-1])
+        downloaded = sum(len(content) for content, _ in server.files.values())
+    return {
+        "scenario": name,
+        "downloaded_bytes": downloaded,
+        "throughput_mb_s": downloaded / result["seconds"] / 1_000_000,
+        **result,
+    }
+
+
+def download(book: Book) -> dict:
+    """
+    Download book to temporary directory and measure resource usage
+
+    :param book: Book to download
+    :returns: Measurements
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        template = os.path.join(directory, "{title}.{ext}")
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        asyncio.run(download_book(book, None, template))
+        seconds = time.perf_counter() - start
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+        written = sum(entry.stat().st_size for entry in os.scandir(directory))
+    return {
+        "written_bytes": written,
+        "seconds": seconds,
+        "cpu_seconds": (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime),
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": usage_after.ru_maxrss / 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "Benchmark grawlix output formats")
+    parser.add_argument("scenarios", nargs = "*", help = f"Scenarios to run (default: all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--scale", type = int, default = 1, help = "Multiplier for size of scenarios")
+    parser.add_argument("--json", action = "store_true", help = "Print results as json lines")
+    parser.add_argument("--child", action = "store_true", help = argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(download(pickle.load(sys.stdin.buffer))))
+        return
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"Unknown scenario: {name}")
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        result = run_scenario(name, args.scale)
+        results.append(result)
+        if args.json:
+            print(json.dumps(result), flush = True)
+    if not args.json:
+        print_table(results)
+
+
+def print_table(results: list[dict]) -> None:
+    from rich.console import Console
+    from rich.table import Table
+    table = Table("Scenario", "Downloaded MB", "Seconds", "MB/s", "CPU s", "Peak RSS MB")
+    for result in results:
+        table.add_row(
+            result["scenario"],
+            f"{result['downloaded_bytes'] / 1_000_000:.1f}",
+            f"{result['seconds']:.2f}",
+            f"{result['throughput_mb_s']:.1f}",
+            f"{result['cpu_seconds']:.2f}",
+            f"{result['peak_rss_mb']:.0f}",
+        )
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark decoding of Manga Plus title listings
+
+Compares `grawlix.sources.mangaplus.parse_title_detail` with decoding through
+blackboxprotobuf and json (the previous implementation) if blackboxprotobuf is
+installed. Recorded responses from the title detail endpoint can be given as
+arguments, otherwise a synthetic listing is generated:
+
+    python -m benchmarks.mangaplus [--chapters N] [response ...]
+"""
+from grawlix.sources.mangaplus import parse_title_detail
+
+from typing import Callable, Union
+import argparse
+import json
+import timeit
+
+Field = tuple[int, Union[int, str, bytes]]
+
+
+def varint(value: int) -> bytes:
+    result = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            result.append(byte | 0x80)
+        else:
+            result.append(byte)
+            return bytes(result)
+
+
+def message(*fields: Field) -> bytes:
+    """Encode message from (field number, value) pairs"""
+    result = bytearray()
+    for field_number, value in fields:
+        if isinstance(value, int):
+            result += varint(field_number << 3) + varint(value)
+        else:
+            if isinstance(value, str):
+                value = value.encode()
+            result += varint(field_number << 3 | 2) + varint(len(value)) + value
+    return bytes(result)
+
+
+def chapter(chapter_id: int) -> bytes:
+    return message(
+        (1, 100000),
+        (2, chapter_id),
+        (3, f"#{chapter_id}"),
+        (4, f"Chapter {chapter_id}: A subtitle long enough to be realistic"),
+        (5, f"https://mangaplus-img.example.com/thumbnails/{chapter_id}.jpg"),
+        (6, 1700000000 + chapter_id),
+        (7, 1800000000 + chapter_id),
+    )
+
+
+def title_detail_response(chapter_count: int) -> bytes:
+    """Synthetic response from the title detail endpoint"""
+    groups = []
+    for start in range(0, chapter_count, 50):
+        ids = range(start, min(start + 50, chapter_count))
+        groups.append((28, message(
+            (1, f"{start}-{start+49}"),
+            *((2, chapter(i)) for i in ids[:3]),
+            *((3, chapter(i)) for i in ids[3:-3]),
+            *((4, chapter(i)) for i in ids[-3:]),
+        )))
+    title = message((1, 100000), (2, "Synthetic title"), (3, "Author"), (4, "https://example.com/portrait.jpg"))
+    title_detail_view = message(
+        (1, title),
+        (2, "https://example.com/image.jpg"),
+        (3, "Overview " * 50),
+        *groups,
+    )
+    return message((1, message((8, title_detail_view))))
+
+
+def blackboxprotobuf_decoder() -> Callable[[bytes], list]:
+    import blackboxprotobuf
+    def decode(content: bytes) -> list:
+        data, _ = blackboxprotobuf.protobuf_to_json(content)
+        parsed = json.loads(data)
+        issues = []
+        for group in parsed["1"]["8"]["28"]:
+            for key in ("2", "3", "4"):
+                chapters = group.get(key, [])
+                for item in chapters if isinstance(chapters, list) else [chapters]:
+                    issues.append(item["2"])
+        return issues
+    return decode
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "Benchmark Manga Plus response decoding")
+    parser.add_argument("responses", nargs = "*", help = "Recorded title detail responses")
+    parser.add_argument("--chapters", type = int, default = 1000, help = "Chapters in synthetic listing")
+    parser.add_argument("--repeat", type = int, default = 20)
+    args = parser.parse_args()
+    if args.responses:
+        inputs = {}
+        for path in args.responses:
+            with open(path, "rb") as f:
+                inputs[path] = f.read()
+    else:
+        inputs = { f"synthetic ({args.chapters} chapters)": title_detail_response(args.chapters) }
+    decoders: dict[str, Callable[[bytes], object]] = {
+        "grawlix": lambda content: parse_title_detail(content).chapter_ids
+    }
+    try:
+        decoders["blackboxprotobuf"] = blackboxprotobuf_decoder()
+    except ImportError:
+        print("blackboxprotobuf is not installed, skipping comparison")
+    for name, content in inputs.items():
+        print(f"{name}: {len(content)} bytes")
+        for decoder_name, decoder in decoders.items():
+            seconds = min(timeit.repeat(lambda: decoder(content), number = 1, repeat = args.repeat))
+            print(f"  {decoder_name:<18}{seconds * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+import threading
+
+# Connections the server accepts before the kernel drops new ones. The
+# default of 5 makes concurrent downloads stall on SYN retransmits
+REQUEST_QUEUE_SIZE = 128
+
+
+class BenchmarkHTTPServer(ThreadingHTTPServer):
+    request_queue_size = REQUEST_QUEUE_SIZE
+    daemon_threads = True
+
+
+class ContentServer:
+    """
+    Local http server serving synthetic content from memory.
+    Runs in a background thread so it does not compete with the event loop
+    being benchmarked.
+    """
+
+    def __init__(self) -> None:
+        self.files: dict[str, tuple[bytes, str]] = {}
+        content = self.files
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _find(self) -> Optional[tuple[bytes, str]]:
+                entry = content.get(self.path)
+                if entry is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                return entry
+
+            def do_HEAD(self) -> None:
+                entry = self._find()
+                if entry:
+                    body, content_type = entry
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+
+            def do_GET(self) -> None:
+                entry = self._find()
+                if entry:
+                    body, content_type = entry
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self._server = BenchmarkHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    def add(self, path: str, content: bytes, content_type: str = "application/octet-stream") -> str:
+        """
+        Serve content at path
+
+        :param path: Path of file on server
+        :param content: Content of file
+        :param content_type: Content type header of file
+        :returns: Full url of file
+        """
+        self.files[path] = (content, content_type)
+        return f"{self.base_url}{path}"
+
+
+    def __enter__(self) -> "ContentServer":
+        self._thread.start()
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -3,14 +3,22 @@ from .config import load_config, Config, SourceConfig
 from .exceptions import SourceNotAuthenticated, GrawlixError, AccessDenied
 from .sources import load_source, Source
 from .output import download_book
-from . import  arguments, logging
+from .output.bandwidth import bandwidth
+from .output.budget import budget
+from .output import cache, zip_writer
+from .output.postprocess import post_processor
+from .archive import Archive, url_key, book_key
+from .scheduler import scheduler
+from . import  arguments, batch, catalog, daemon, logging, metrics, plan, tracing, watch
 
-from typing import Tuple, Optional
+from typing import Tuple, Type, Union, Optional
 from rich.prompt import Prompt
 from rich.progress import Progress
 from functools import partial
 import os
+import sys
 import asyncio
+import json
 import traceback
 
 
@@ -20,7 +28,7 @@ def get_or_ask(attr: str, hidden: bool, source_config: Optional[SourceConfig], o
     or Prompt.ask(attr.capitalize(), password=hidden)
 
 
-def get_login(source: Source, config: Config, options) -> Tuple[str, str]:
+def get_login(source: Union[Source, Type[Source]], config: Config, options) -> Tuple[str, str]:
     """
     Get login credentials for source
 
@@ -94,24 +102,75 @@ async def authenticate(url: str, source: Source, config: Config, options):
         raise SourceNotAuthenticated
 
 
+def configure(args, config: Config) -> None:
+    """
+    Apply options shared by all commands
+
+    :param args: Command line options
+    :param config: Content of config file
+    """
+    logging.debug_mode = args.debug
+    budget.limit = args.memory_limit
+    if args.cache:
+        cache.file_cache = cache.FileCache(cache.default_cache_directory(), args.cache_size)
+    post_processor.hooks = config.postprocess
+    post_processor.workers = args.postprocess_workers
+    zip_writer.compression_levels.update(config.compression)
+    if not args.no_catalog:
+        catalog.catalog = catalog.Catalog(args.catalog or catalog.default_catalog_location())
+    scheduler.configure(args.max_requests)
+    bandwidth.weights = config.bandwidth_shares
+    bandwidth.configure(
+        args.bandwidth_limit or config.bandwidth_limit,
+        args.bandwidth_burst or config.bandwidth_burst,
+    )
+
+
 async def main() -> None:
     args = arguments.parse_arguments()
     config = load_config()
-    logging.debug_mode = args.debug
+    if args.plan:
+        # Planning writes nothing, not even the catalog or file cache
+        args.no_catalog = True
+        args.cache = False
+    configure(args, config)
     urls = get_urls(args)
+    if args.trace:
+        tracing.enable()
+    try:
+        if args.plan:
+            archive = Archive(args.archive) if args.archive else None
+            await plan.run(urls, config, args, archive)
+        elif args.workers > 1:
+            # Waits for the worker processes and can prompt for credentials,
+            # so it runs outside of the event loop
+            await asyncio.to_thread(batch.run, urls, config, args)
+        else:
+            archive = Archive(args.archive) if args.archive else None
+            try:
+                await download_urls(urls, config, args, archive)
+            finally:
+                # Commands for books written before a failure still finish
+                await post_processor.wait()
+    finally:
+        if args.metrics:
+            metrics.export(args.metrics)
+        if args.trace:
+            tracing.write(args.trace)
+
+
+async def download_urls(urls: list[str], config: Config, args, archive: Optional[Archive] = None) -> None:
+    """
+    Download all books and series in urls
+
+    :param urls: Urls to download
+    :param config: Content of config file
+    :param args: Command line options
+    :param archive: Archive of completed books
+    """
     for url in urls:
         try:
-            source: Source = load_source(url)
-            if not source.authenticated and source.requires_authentication:
-                await authenticate(url, source, config, args)
-            result = await source.download(url)
-            if isinstance(result, Book):
-                with logging.progress(result.metadata.title, source.name) as progress:
-                    template: str = args.output or "{title}.{ext}"
-                    await download_with_progress(result, progress, template)
-            elif isinstance(result, Series):
-                await download_series(source, result, args)
-            logging.info("")
+            await download_url(url, config, args, archive)
         except GrawlixError as error:
             error.print_error()
             if logging.debug_mode:
@@ -119,40 +178,149 @@ async def main() -> None:
             exit(1)
 
 
-async def download_series(source: Source, series: Series, args) -> None:
+async def download_url(url: str, config: Config, args, archive: Optional[Archive] = None) -> None:
+    """
+    Download book or series in url
+
+    :param url: Url to download
+    :param config: Content of config file
+    :param args: Command line options
+    :param archive: Archive of completed books
+    """
+    if archive is not None and url_key(url) in archive:
+        logging.info(f"Skipping {url} - Already downloaded")
+        return
+    source: Source = load_source(url)
+    if not source.authenticated and source.requires_authentication:
+        with metrics.phase("authenticate"):
+            await authenticate(url, source, config, args)
+    with metrics.phase("metadata"):
+        result = await source.download(url)
+    if isinstance(result, Book):
+        with logging.progress(result.metadata.title, source.name) as progress:
+            template: str = args.output or "{title}.{ext}"
+            await download_with_progress(result, progress, template, source, url)
+        if archive is not None:
+            archive.add(url_key(url))
+    elif isinstance(result, Series):
+        await download_series(source, result, args, archive)
+    logging.info("")
+
+
+async def download_series(source: Source, series: Series, args, archive: Optional[Archive] = None) -> None:
     """
     Download books in series
 
     :param series: Series to download
+    :param archive: Archive of completed books
     """
     template = args.output or "{series}/{title}.{ext}"
-    with logging.progress(series.title, source.name, len(series.book_ids)) as progress:
-        for book_id in series.book_ids:
+    book_ids = series.book_ids
+    if archive is not None:
+        book_ids = [book_id for book_id in book_ids if book_key(source, book_id) not in archive]
+        if len(book_ids) < len(series.book_ids):
+            logging.info(f"Skipping {len(series.book_ids) - len(book_ids)} books - Already downloaded")
+    with logging.progress(series.title, source.name, len(book_ids)) as progress:
+        for book_id in book_ids:
             try:
-                book: Book = await source.download_book_from_id(book_id)
-                await download_with_progress(book, progress, template)
+                with metrics.phase("metadata"):
+                    book: Book = await source.download_book_from_id(book_id)
+                await download_with_progress(book, progress, template, source, catalog.id_key(book_id))
             except AccessDenied as error:
                 logging.info("Skipping - Access Denied")
+                continue
+            if archive is not None:
+                archive.add(book_key(source, book_id))
 
 
 
-async def download_with_progress(book: Book, progress: Progress, template: str):
+async def download_with_progress(book: Book, progress: Progress, template: str, source: Source, book_id: str):
     """
     Download book with progress bar in cli
 
     :param book: Book to download
     :param progress: Progress object
     :param template: Output template
+    :param source: Source book is from
+    :param book_id: Id of book stored in catalog
     """
     task = logging.add_book(progress, book)
     update_function = partial(progress.advance, task)
-    await download_book(book, update_function, template)
+    with tracing.span(book.metadata.title, "book"):
+        await download_book(book, update_function, template, source = source.name, book_id = book_id)
     progress.advance(task, 1)
 
 
+async def watch_series(args) -> None:
+    """
+    Watch series for new books
+
+    :param args: Command line options for watch command
+    """
+    config = load_config()
+    configure(args, config)
+    state = watch.WatchState(args.state or watch.default_state_location())
+    urls = get_urls(args) or list(state.series.keys())
+    urls = [url for url in urls if url]
+    try:
+        # Authentication happens up front, since polls may be hours apart
+        for url in urls:
+            try:
+                source: Source = load_source(url)
+                if not source.authenticated and source.requires_authentication:
+                    await authenticate(url, source, config, args)
+            except GrawlixError as error:
+                error.print_error()
+                exit(1)
+        watcher = watch.Watcher(state, args.output, args.baseline)
+        await watcher.run(urls, args.interval, args.once)
+    finally:
+        await post_processor.wait()
+
+
+def show_catalog(args) -> None:
+    """
+    Print books in catalog matching query
+
+    :param args: Command line options for catalog command
+    """
+    library = catalog.Catalog(args.catalog or catalog.default_catalog_location())
+    books = library.find(catalog.Query(
+        source = args.source,
+        series = args.series,
+        title = args.title,
+        author = args.author,
+        publisher = args.publisher,
+        year = args.year,
+        released_after = args.released_after,
+        released_before = args.released_before,
+    ))
+    library.close()
+    if args.json:
+        for book in books:
+            print(json.dumps(book))
+    elif args.count:
+        total_size = sum(book["size"] for book in books)
+        print(f"{len(books)} books, {total_size / 1024**2:.1f} MiB")
+    else:
+        logging.print_books(books)
+
+
 def run() -> None:
     """Start main function"""
-    asyncio.run(main())
+    if sys.argv[1:2] == ["serve"]:
+        args = arguments.parse_serve_arguments(sys.argv[2:])
+        config = load_config()
+        configure(args, config)
+        asyncio.run(daemon.serve(config, args))
+    elif sys.argv[1:2] == ["catalog"]:
+        args = arguments.parse_catalog_arguments(sys.argv[2:])
+        show_catalog(args)
+    elif sys.argv[1:2] == ["watch"]:
+        args = arguments.parse_watch_arguments(sys.argv[2:])
+        asyncio.run(watch_series(args))
+    else:
+        asyncio.run(main())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+from grawlix.sources import Source
+
+from typing import Any
+import json
+import os
+
+
+class Archive:
+    """
+    File listing completed books (one per line), so books are not downloaded
+    again by later runs
+    """
+
+    def __init__(self, location: str):
+        """
+        :param location: Path of archive file
+        """
+        self.location = location
+        self.keys: set[str] = set()
+        if os.path.exists(location):
+            with open(location, "r") as f:
+                self.keys = { line.strip() for line in f if line.strip() }
+
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+
+    def add(self, key: str) -> None:
+        """
+        Mark book as completed
+
+        :param key: Key from `url_key` or `book_key`
+        """
+        if key in self.keys:
+            return
+        self.keys.add(key)
+        with open(self.location, "a") as f:
+            f.write(f"{key}\n")
+
+
+def url_key(url: str) -> str:
+    """Archive key of book downloaded directly from url"""
+    return url.strip()
+
+
+def book_key(source: Source, book_id: Any) -> str:
+    """Archive key of book in series"""
+    return f"{source.name} {json.dumps(book_id)}"
@@ -1,4 +1,5 @@
 from grawlix import __version__
+from grawlix.utils import parse_size, parse_duration
 
 import argparse
 
@@ -52,6 +53,27 @@ def parse_arguments() -> argparse.Namespace:
         help = "Output destination",
         dest = "output"
     )
+    parser.add_argument(
+        '--archive',
+        help = "File recording completed books. Books in it are skipped",
+        dest = "archive"
+    )
+    parser.add_argument(
+        '--plan',
+        help = "Show how many books and bytes would be downloaded and how long it would take, without downloading anything",
+        dest = "plan",
+        action = "store_true",
+    )
+    # Batch
+    parser.add_argument(
+        '-w',
+        '--workers',
+        help = "Number of processes downloading at the same time. Urls from the same source are downloaded by the same process, and bandwidth, memory and request limits are split between processes (default: 1)",
+        dest = "workers",
+        type = int,
+        default = 1,
+    )
+    add_resource_arguments(parser)
     # Logging
     parser.add_argument(
         '--debug',
@@ -59,4 +81,270 @@ def parse_arguments() -> argparse.Namespace:
         dest = "debug",
         action="store_true",
     )
+    parser.add_argument(
+        '--metrics',
+        help = "Write metrics to file at end of run (Prometheus textfile if path ends with .prom, otherwise json lines)",
+        dest = "metrics",
+    )
+    parser.add_argument(
+        '--trace',
+        help = "Write spans of every book and phase to file in the Chrome trace event format",
+        dest = "trace",
+    )
     return parser.parse_args()
+
+
+def parse_serve_arguments(args: list[str]) -> argparse.Namespace:
+    """
+    Parse arguments for `grawlix serve`
+
+    :param args: Arguments after `serve`
+    """
+    parser = argparse.ArgumentParser(
+        prog = "grawlix serve",
+        description = "Run grawlix as a service accepting download jobs over http"
+    )
+    parser.add_argument(
+        '--host',
+        help = "Address to listen on (default: 127.0.0.1)",
+        dest = "host",
+        default = "127.0.0.1",
+    )
+    parser.add_argument(
+        '--port',
+        help = "Port to listen on (default: 8421)",
+        dest = "port",
+        type = int,
+        default = 8421,
+    )
+    parser.add_argument(
+        '--socket',
+        help = "Listen on unix socket instead of tcp",
+        dest = "socket",
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        help = "Number of jobs downloaded at the same time (default: 1)",
+        dest = "jobs",
+        type = int,
+        default = 1,
+    )
+    parser.add_argument(
+        '-c',
+        '--cookies',
+        help = "Path to netscape cookie file",
+        dest = "cookie_file"
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        help = "Default output destination for jobs",
+        dest = "output"
+    )
+    add_resource_arguments(parser)
+    parser.add_argument(
+        '--debug',
+        help = "Enable debug messages",
+        dest = "debug",
+        action="store_true",
+    )
+    return parser.parse_args(args)
+
+
+def parse_watch_arguments(args: list[str]) -> argparse.Namespace:
+    """
+    Parse arguments for `grawlix watch`
+
+    :param args: Arguments after `watch`
+    """
+    parser = argparse.ArgumentParser(
+        prog = "grawlix watch",
+        description = "Download new books in series as they are released"
+    )
+    parser.add_argument(
+        'urls',
+        help = "Links to series to watch. Every watched series is used if none are given",
+        nargs = "*",
+    )
+    parser.add_argument(
+        '-f',
+        '--file',
+        help = "File with links to series (one link per line)",
+        dest = "file"
+    )
+    parser.add_argument(
+        '--interval',
+        help = "Time between checks of each series (ex. 30m, 6h, 1d) (default: 6h)",
+        dest = "interval",
+        type = parse_duration,
+        default = "6h",
+    )
+    parser.add_argument(
+        '--once',
+        help = "Check every series once, download new books and exit",
+        dest = "once",
+        action = "store_true",
+    )
+    parser.add_argument(
+        '--baseline',
+        help = "Mark books in newly watched series as known without downloading them",
+        dest = "baseline",
+        action = "store_true",
+    )
+    parser.add_argument(
+        '--state',
+        help = "File storing known books of watched series",
+        dest = "state",
+    )
+    parser.add_argument(
+        '-c',
+        '--cookies',
+        help = "Path to netscape cookie file",
+        dest = "cookie_file"
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        help = "Output destination",
+        dest = "output"
+    )
+    add_resource_arguments(parser)
+    parser.add_argument(
+        '--debug',
+        help = "Enable debug messages",
+        dest = "debug",
+        action="store_true",
+    )
+    return parser.parse_args(args)
+
+
+def parse_catalog_arguments(args: list[str]) -> argparse.Namespace:
+    """
+    Parse arguments for `grawlix catalog`
+
+    :param args: Arguments after `catalog`
+    """
+    parser = argparse.ArgumentParser(
+        prog = "grawlix catalog",
+        description = "Search catalog of downloaded books"
+    )
+    parser.add_argument(
+        '--source',
+        help = "Name of source (ex. marvel)",
+        dest = "source",
+    )
+    parser.add_argument(
+        '--series',
+        help = "Part of series name",
+        dest = "series",
+    )
+    parser.add_argument(
+        '--title',
+        help = "Part of title",
+        dest = "title",
+    )
+    parser.add_argument(
+        '--author',
+        help = "Part of author name",
+        dest = "author",
+    )
+    parser.add_argument(
+        '--publisher',
+        help = "Part of publisher name",
+        dest = "publisher",
+    )
+    parser.add_argument(
+        '--year',
+        help = "Year of release",
+        dest = "year",
+        type = int,
+    )
+    parser.add_argument(
+        '--after',
+        help = "Released on or after date (ex. 2019-06-01)",
+        dest = "released_after",
+    )
+    parser.add_argument(
+        '--before',
+        help = "Released before date (ex. 2020-01-01)",
+        dest = "released_before",
+    )
+    parser.add_argument(
+        '--count',
+        help = "Only print number and total size of matching books",
+        dest = "count",
+        action = "store_true",
+    )
+    parser.add_argument(
+        '--json',
+        help = "Print matching books as json lines",
+        dest = "json",
+        action = "store_true",
+    )
+    parser.add_argument(
+        '--catalog',
+        help = "Database of downloaded books (default: catalog.sqlite in the user data directory)",
+        dest = "catalog",
+    )
+    return parser.parse_args(args)
+
+
+def add_resource_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add arguments controlling memory, disk and network usage"""
+    parser.add_argument(
+        '--memory-limit',
+        help = "Maximum number of bytes held by concurrent downloads (ex. 512M)",
+        dest = "memory_limit",
+        type = parse_size,
+    )
+    parser.add_argument(
+        '--cache',
+        help = "Keep downloaded files in a local cache, so interrupted or repeated downloads can reuse them",
+        dest = "cache",
+        action = "store_true",
+    )
+    parser.add_argument(
+        '--cache-size',
+        help = "Maximum size of file cache (default: 2G)",
+        dest = "cache_size",
+        type = parse_size,
+        default = "2G",
+    )
+    parser.add_argument(
+        '--catalog',
+        help = "Database of downloaded books (default: catalog.sqlite in the user data directory)",
+        dest = "catalog",
+    )
+    parser.add_argument(
+        '--no-catalog',
+        help = "Do not add downloaded books to the catalog",
+        dest = "no_catalog",
+        action = "store_true",
+    )
+    parser.add_argument(
+        '--bandwidth-limit',
+        help = "Maximum download rate in bytes per second for all downloads combined (ex. 10M)",
+        dest = "bandwidth_limit",
+        type = parse_size,
+    )
+    parser.add_argument(
+        '--bandwidth-burst',
+        help = "Bytes that can be downloaded at full speed after a pause (default: one second at the bandwidth limit)",
+        dest = "bandwidth_burst",
+        type = parse_size,
+    )
+    parser.add_argument(
+        '--max-requests',
+        help = "Maximum number of http requests in flight (default: 32). Some are kept free for metadata requests, so they never wait behind file downloads",
+        dest = "max_requests",
+        type = int,
+        default = 32,
+    )
+    parser.add_argument(
+        '--postprocess-workers',
+        help = "Number of post processing commands running at the same time (default: 2)",
+        dest = "postprocess_workers",
+        type = int,
+        default = 2,
+    )
@@ -0,0 +1,273 @@
+"""
+Download urls with multiple processes
+
+Urls are split into shards, one per worker process. Urls from a source
+requiring authentication are kept in the same shard, so each source is only
+authenticated once. Workers forward output, progress and completed books to
+the parent process, which displays progress and writes the archive.
+"""
+from grawlix.archive import Archive
+from grawlix.config import Config, SourceConfig
+from grawlix.exceptions import GrawlixError
+from grawlix.sources import find_source, Source
+from grawlix import logging, metrics, tracing
+
+from rich.console import Console
+from rich.progress import TaskID
+from rich.text import Text
+from typing import Any, IO, Optional, cast
+import asyncio
+import itertools
+import multiprocessing
+import queue
+import traceback
+
+
+def shard_urls(urls: list[str], shard_count: int) -> list[list[str]]:
+    """
+    Split urls into shards of roughly equal size. Urls from a source requiring
+    authentication are never split between shards.
+
+    :param urls: Urls to split
+    :param shard_count: Maximum number of shards
+    :returns: Non-empty shards
+    """
+    groups: dict[str, list[str]] = {}
+    for url in urls:
+        try:
+            source = find_source(url)
+            key = source.name if source._authentication_methods else url
+        except GrawlixError:
+            key = url
+        groups.setdefault(key, []).append(url)
+    shards: list[list[str]] = [[] for _ in range(shard_count)]
+    # Largest groups first to the currently smallest shard
+    for group in sorted(groups.values(), key = len, reverse = True):
+        min(shards, key = len).extend(group)
+    return [shard for shard in shards if shard]
+
+
+class RemoteProgress:
+    """Progress bar in worker process forwarding updates to the parent"""
+
+    _task_ids = itertools.count()
+
+    def __init__(self, messages: multiprocessing.Queue, worker: int):
+        self.messages = messages
+        self.worker = worker
+        self.tasks: list[int] = []
+
+
+    def __enter__(self) -> "RemoteProgress":
+        return self
+
+
+    def __exit__(self, *_) -> None:
+        self.messages.put(("close", self.worker, self.tasks))
+
+
+    def add_task(self, description: str, total: float = 1, **_) -> int:
+        task = next(self._task_ids)
+        self.tasks.append(task)
+        self.messages.put(("add_task", self.worker, task, description, total))
+        return task
+
+
+    def advance(self, task: int, advance: float = 1) -> None:
+        self.messages.put(("advance", self.worker, task, advance))
+
+
+class RemoteOutput:
+    """File-like object forwarding console output to the parent"""
+
+    def __init__(self, messages: multiprocessing.Queue):
+        self.messages = messages
+
+
+    def write(self, text: str) -> int:
+        self.messages.put(("output", text))
+        return len(text)
+
+
+    def flush(self) -> None:
+        pass
+
+
+class RemoteArchive(Archive):
+    """Archive in worker process. Completed books are written by the parent"""
+
+    def __init__(self, keys: set[str], messages: multiprocessing.Queue):
+        self.keys = keys
+        self.messages = messages
+
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+
+    def add(self, key: str) -> None:
+        self.keys.add(key)
+        self.messages.put(("archive", key))
+
+
+def run(urls: list[str], config: Config, args) -> None:
+    """
+    Download urls with `args.workers` processes
+
+    :param urls: Urls to download
+    :param config: Content of config file
+    :param args: Command line options
+    """
+    urls = [url for url in urls if url]
+    shards = shard_urls(urls, args.workers)
+    archive = Archive(args.archive) if args.archive else None
+    # Workers can not prompt for credentials, so they are asked for up front
+    prepare_credentials(urls, config, args)
+    # Every worker limits its own downloads, so process wide limits are
+    # split between them
+    if shards:
+        split_limits(args, config, len(shards))
+    context = multiprocessing.get_context("spawn")
+    messages = context.Queue()
+    processes = [
+        context.Process(
+            target = worker_main,
+            args = (
+                index,
+                shard,
+                config,
+                args,
+                messages,
+                archive.keys if archive else None,
+                logging.console.width,
+            ),
+            daemon = True,
+        )
+        for index, shard in enumerate(shards)
+    ]
+    for process in processes:
+        process.start()
+    failed = receive_messages(messages, processes, archive)
+    logging.info(f"Downloaded [yellow not bold]{len(urls) - len(failed)}[/] of [yellow not bold]{len(urls)}[/] urls with [yellow not bold]{len(processes)}[/] workers")
+    for url, error in failed:
+        logging.error(f"[red]Failed[/] {url} ({error})")
+    if failed:
+        exit(1)
+
+
+def split_limits(args, config: Config, workers: int) -> None:
+    """
+    Divide bandwidth, memory and request limits between worker processes
+
+    :param args: Command line options. Changed in place
+    :param config: Content of config file
+    :param workers: Number of worker processes
+    """
+    bandwidth_limit = args.bandwidth_limit or config.bandwidth_limit
+    if bandwidth_limit:
+        # A limit of 0 would mean no limit
+        args.bandwidth_limit = max(1, bandwidth_limit // workers)
+    if args.memory_limit:
+        args.memory_limit = max(1, args.memory_limit // workers)
+    # Two slots, so one is left for bulk requests next to the reserved one
+    args.max_requests = max(2, args.max_requests // workers)
+
+
+def prepare_credentials(urls: list[str], config: Config, args) -> None:
+    """Ask for login credentials of sources missing them in config"""
+    # Imported here to avoid a circular import
+    from grawlix.__main__ import get_login
+    # Source classes are enough to find the credentials. Instances would
+    # open http clients that are never used
+    sources: dict[str, type[Source]] = {}
+    for url in urls:
+        try:
+            source_cls = find_source(url)
+        except GrawlixError:
+            continue
+        sources.setdefault(source_cls.name, source_cls)
+    for source in sources.values():
+        if "login" in source._authentication_methods:
+            username, password = get_login(source, config, args)
+            key = source.name.lower().replace(" ", "")
+            config.sources[key] = SourceConfig(username, password)
+
+
+def receive_messages(messages: multiprocessing.Queue, processes: list, archive: Optional[Archive]) -> list[tuple[str, str]]:
+    """
+    Display progress from workers until all workers are finished
+
+    :returns: Failed urls with error
+    """
+    failed: list[tuple[str, str]] = []
+    tasks: dict[tuple[int, int], TaskID] = {}
+    running = len(processes)
+    with logging.progress_bar() as progress:
+        while running > 0:
+            try:
+                message = messages.get(timeout = 1)
+            except queue.Empty:
+                # Workers that crashed never send their exit message
+                if not any(process.is_alive() for process in processes):
+                    break
+                continue
+            kind, *values = message
+            if kind == "output":
+                progress.console.print(Text.from_ansi(values[0]), end = "")
+            elif kind == "add_task":
+                worker, task, description, total = values
+                tasks[worker, task] = progress.add_task(description, total = total)
+            elif kind == "advance":
+                worker, task, advance = values
+                progress.advance(tasks[worker, task], advance)
+            elif kind == "close":
+                worker, worker_tasks = values
+                for task in worker_tasks:
+                    progress.remove_task(tasks.pop((worker, task)))
+            elif kind == "archive" and archive is not None:
+                archive.add(values[0])
+            elif kind == "metrics":
+                metrics.merge(values[0])
+            elif kind == "trace":
+                tracing.add_events(values[0])
+            elif kind == "failed":
+                failed.append(tuple(values))
+            elif kind == "exit":
+                running -= 1
+    for process in processes:
+        process.join()
+    return failed
+
+
+def worker_main(index: int, urls: list[str], config: Config, args, messages: multiprocessing.Queue, archive_keys: Optional[set[str]], width: int) -> None:
+    """Entry point of worker process"""
+    # Imported here to avoid a circular import
+    from grawlix.__main__ import configure, download_url
+    from grawlix.output.postprocess import post_processor
+    # Console only writes and flushes its file
+    logging.console = Console(file = cast(IO[str], RemoteOutput(messages)), force_terminal = True, width = width)
+    logging.progress_factory = lambda: RemoteProgress(messages, index)
+    archive = RemoteArchive(archive_keys, messages) if archive_keys is not None else None
+
+    async def download_shard() -> None:
+        for url in urls:
+            try:
+                await download_url(url, config, args, archive)
+            except Exception as error:
+                if logging.debug_mode:
+                    logging.error(traceback.format_exc())
+                messages.put(("failed", url, type(error).__name__))
+        await post_processor.wait()
+
+    try:
+        configure(args, config)
+        if args.trace:
+            tracing.enable()
+        asyncio.run(download_shard())
+    finally:
+        # Exported by the parent together with the other workers
+        if args.metrics:
+            messages.put(("metrics", metrics.metrics))
+        if args.trace:
+            messages.put(("trace", tracing.events()))
+        messages.put(("exit", index))
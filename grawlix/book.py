@@ -38,6 +38,8 @@ class OnlineFile:
     encryption: Optional[Encryption] = None
     headers: Optional[dict[str, str]] = None
     cookies: Optional[Any] = None # TODO Change type
+    # Identifies file across downloads when the url does not (ex. signed urls)
+    cache_key: Optional[str] = None
 
 @dataclass(slots=True)
 class OfflineFile:
@@ -0,0 +1,216 @@
+"""
+Catalog of downloaded books
+
+Every book written by `download_book` is added to a SQLite database with its
+metadata, source, output path, size and checksum. Questions about the library
+(ex. which Marvel issues from 2019 are downloaded) are answered from the
+indexed database instead of by opening the files.
+"""
+from grawlix.book import Book
+from grawlix import logging
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from hashlib import sha256
+from typing import Any, Optional
+import appdirs
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    path TEXT PRIMARY KEY,
+    source TEXT,
+    book_id TEXT,
+    title TEXT NOT NULL,
+    series TEXT,
+    series_index TEXT,
+    authors TEXT,
+    language TEXT,
+    publisher TEXT,
+    identifier TEXT,
+    description TEXT,
+    release_date TEXT,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    added TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS books_source_release_date ON books (source, release_date);
+CREATE INDEX IF NOT EXISTS books_series ON books (series, series_index);
+CREATE INDEX IF NOT EXISTS books_title ON books (title);
+CREATE INDEX IF NOT EXISTS books_release_date ON books (release_date);
+"""
+
+COLUMNS = [
+    "path", "source", "book_id", "title", "series", "series_index", "authors",
+    "language", "publisher", "identifier", "description", "release_date",
+    "size", "sha256", "added",
+]
+
+# Seconds to wait for other processes (ex. batch workers) writing at the same time
+LOCK_TIMEOUT = 30
+
+
+@dataclass(slots=True)
+class Query:
+    """Filters for books in catalog. Filters that are None are not used"""
+    source: Optional[str] = None
+    series: Optional[str] = None
+    title: Optional[str] = None
+    author: Optional[str] = None
+    publisher: Optional[str] = None
+    year: Optional[int] = None
+    released_after: Optional[str] = None
+    released_before: Optional[str] = None
+
+
+def source_key(name: str) -> str:
+    """Name of source as written in the config file (ex. "dcuniverseinfinite")"""
+    return name.lower().replace(" ", "")
+
+
+def id_key(book_id: Any) -> str:
+    """Book id of source as text. Ids that are not strings are stored as json"""
+    if isinstance(book_id, str):
+        return book_id
+    return json.dumps(book_id)
+
+
+def file_checksum(location: str) -> tuple[int, str]:
+    """
+    Size and sha256 digest of file
+
+    :param location: Path of file
+    """
+    digest = sha256()
+    size = 0
+    with open(location, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+
+class Catalog:
+    """SQLite database of downloaded books"""
+
+    def __init__(self, location: str):
+        """
+        :param location: Path of database. Created if it does not exist
+        """
+        parent = os.path.dirname(location)
+        if parent:
+            os.makedirs(parent, exist_ok = True)
+        # Books are added from worker threads, so waiting for the write lock
+        # held by other processes never blocks the event loop
+        self._connection = sqlite3.connect(location, timeout = LOCK_TIMEOUT, check_same_thread = False)
+        self._lock = threading.Lock()
+        self._connection.row_factory = sqlite3.Row
+        # Readers are not blocked while books are added
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+    async def add(self, book: Book, location: str, source: Optional[str] = None, book_id: Optional[str] = None) -> None:
+        """
+        Add downloaded book to catalog. Replaces earlier entry with the same
+        path. Failures are logged, so they never fail the download.
+
+        :param book: Downloaded book
+        :param location: Path of output file
+        :param source: Name of source book is from
+        :param book_id: Id of book in source, or url if it was downloaded directly
+        """
+        metadata = {
+            key: None if value == "UNKNOWN" else value
+            for key, value in book.metadata.as_dict().items()
+        }
+        row = {
+            "path": os.path.abspath(location),
+            "source": source_key(source) if source else None,
+            "book_id": book_id,
+            "title": metadata["title"],
+            "series": metadata["series"],
+            "series_index": metadata["index"],
+            "authors": metadata["authors"] or None,
+            "language": metadata["language"],
+            "publisher": metadata["publisher"],
+            "identifier": metadata["identifier"],
+            "description": metadata["description"],
+            "release_date": metadata["release_date"],
+            "added": datetime.now(timezone.utc).isoformat(timespec = "seconds"),
+        }
+        try:
+            # Reading large files and waiting for the database lock both
+            # happen outside of the event loop
+            await asyncio.to_thread(self._insert, location, row)
+        except (OSError, sqlite3.Error) as error:
+            logging.error(f"Could not add {os.path.basename(location)} to catalog: {error}")
+
+
+    def _insert(self, location: str, row: dict[str, Any]) -> None:
+        row["size"], row["sha256"] = file_checksum(location)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO books ({', '.join(COLUMNS)}) VALUES ({', '.join(':' + column for column in COLUMNS)})",
+                row
+            )
+
+
+    def find(self, query: Query) -> list[dict[str, Any]]:
+        """
+        Find books matching query
+
+        :param query: Filters
+        :returns: Matching books ordered by source, series and index
+        """
+        conditions: list[str] = []
+        values: list[Any] = []
+        if query.source is not None:
+            conditions.append("source = ?")
+            values.append(source_key(query.source))
+        if query.series is not None:
+            conditions.append("series LIKE ?")
+            values.append(f"%{query.series}%")
+        if query.title is not None:
+            conditions.append("title LIKE ?")
+            values.append(f"%{query.title}%")
+        if query.author is not None:
+            conditions.append("authors LIKE ?")
+            values.append(f"%{query.author}%")
+        if query.publisher is not None:
+            conditions.append("publisher LIKE ?")
+            values.append(f"%{query.publisher}%")
+        # Dates are stored in iso format, so ranges can use the index
+        if query.year is not None:
+            conditions.append("release_date >= ? AND release_date < ?")
+            values.extend([f"{query.year:04}", f"{query.year + 1:04}"])
+        if query.released_after is not None:
+            conditions.append("release_date >= ?")
+            values.append(query.released_after)
+        if query.released_before is not None:
+            conditions.append("release_date < ?")
+            values.append(query.released_before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT * FROM books {where} ORDER BY source, series, CAST(series_index AS REAL), release_date, title",
+                values
+            )
+            return [dict(row) for row in rows]
+
+
+def default_catalog_location() -> str:
+    return os.path.join(appdirs.user_data_dir("grawlix", "jo1gi"), "catalog.sqlite")
+
+
+# Catalog used by `download_book`. Books are not cataloged if None
+catalog: Optional[Catalog] = None
@@ -1,5 +1,7 @@
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from grawlix.utils import parse_size
+
+from typing import Optional, Union
 import tomli
 import appdirs
 import os
@@ -16,6 +18,15 @@ class SourceConfig:
 class Config:
     """Grawlix configuration"""
     sources: dict[str, SourceConfig]
+    # Commands run on output files by extension
+    postprocess: dict[str, list[list[str]]] = field(default_factory=dict)
+    # Compression level (0-9) of files in zip based outputs by media type
+    compression: dict[str, int] = field(default_factory=dict)
+    # Maximum download rate in bytes per second and burst size in bytes
+    bandwidth_limit: Optional[int] = None
+    bandwidth_burst: Optional[int] = None
+    # Weighted shares of bandwidth by source
+    bandwidth_shares: dict[str, float] = field(default_factory=dict)
 
 
 def load_config() -> Config:
@@ -38,4 +49,32 @@ def load_config() -> Config:
                 username = values.get("username"),
                 password = values.get("password"),
             )
-    return Config(sources)
+    postprocess = {}
+    for extension, commands in config_dict.get("postprocess", {}).items():
+        # A single command can be given without the surrounding list
+        if commands and isinstance(commands[0], str):
+            commands = [commands]
+        postprocess[extension] = commands
+    compression = {
+        media_type: int(level)
+        for media_type, level in config_dict.get("compression", {}).items()
+    }
+    bandwidth = config_dict.get("bandwidth", {})
+    return Config(
+        sources,
+        postprocess,
+        compression,
+        bandwidth_limit = read_size(bandwidth.get("limit")),
+        bandwidth_burst = read_size(bandwidth.get("burst")),
+        bandwidth_shares = {
+            source: float(weight)
+            for source, weight in bandwidth.get("shares", {}).items()
+        },
+    )
+
+
+def read_size(value: Union[str, int, None]) -> Optional[int]:
+    """Read size from config file given either as number of bytes or string"""
+    if value is None or isinstance(value, int):
+        return value
+    return parse_size(value)
@@ -0,0 +1,340 @@
+"""
+Long running download service
+
+Keeps sources authenticated and http connections open between jobs. Jobs are
+submitted and monitored through a small json api served over tcp or a unix
+socket:
+
+    POST /jobs          {"url": "...", "output": "{title}.{ext}"}
+    GET  /jobs          List all jobs
+    GET  /jobs/<id>     Status and progress of job
+    GET  /metrics       Metrics in the Prometheus text format
+"""
+from grawlix.book import Book, Series
+from grawlix.config import Config
+from grawlix.exceptions import GrawlixError, SourceNotAuthenticated, AccessDenied
+from grawlix.network import create_client
+from grawlix.output import download_book, get_output_format, format_output_location
+from grawlix.scheduler import BULK
+from grawlix.sources import load_source, Source
+from grawlix import catalog, logging, metrics, tracing
+
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Any
+import asyncio
+import httpx
+import itertools
+import json
+import os
+import time
+import traceback
+
+MAX_REQUEST_SIZE = 1024 * 1024
+# Finished jobs are forgotten after this many seconds, or when there are more
+# of them than the limit
+FINISHED_JOB_TTL = 24 * 60 * 60
+MAX_FINISHED_JOBS = 1000
+
+
+@dataclass(slots=True)
+class Job:
+    """Download of a single url"""
+    id: int
+    url: str
+    output: Optional[str] = None
+    status: str = "queued"
+    title: Optional[str] = None
+    source: Optional[str] = None
+    books_total: int = 0
+    books_done: int = 0
+    books_skipped: int = 0
+    progress: float = 0.
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        self.status = status
+        self.message = message
+
+
+class Daemon:
+    """Job queue and the workers processing it"""
+
+    def __init__(self, config: Config, cookie_file: Optional[str], default_output: Optional[str], workers: int):
+        """
+        :param config: Content of config file. Used for login credentials
+        :param cookie_file: Cookie file for sources supporting cookies
+        :param default_output: Output template used when a job does not have one
+        :param workers: Number of jobs processed at the same time
+        """
+        self.config = config
+        self.cookie_file = cookie_file
+        self.default_output = default_output
+        self.jobs: dict[int, Job] = {}
+        self._queue: asyncio.Queue[Job] = asyncio.Queue()
+        self._ids = itertools.count(1)
+        self._worker_count = workers
+        self._auth_lock = asyncio.Lock()
+        # Shared by all downloads, so connections are reused between jobs
+        self._client = create_client(BULK)
+
+
+    def submit(self, url: str, output: Optional[str] = None) -> Job:
+        """
+        Add job to queue
+
+        :param url: Url of book or series
+        :param output: Output template
+        :returns: New job
+        """
+        job = Job(id = next(self._ids), url = url, output = output)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        return job
+
+
+    async def run_workers(self) -> None:
+        await asyncio.gather(*[self._worker() for _ in range(self._worker_count)])
+
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started = time.time()
+            try:
+                await self._run_job(job)
+                job.status = "done"
+            except GrawlixError as error:
+                job.status = "failed"
+                job.error = type(error).__name__
+            except Exception as error:
+                job.status = "failed"
+                job.error = repr(error)
+                if logging.debug_mode:
+                    traceback.print_exc()
+            job.finished = time.time()
+            logging.info(f"Job {job.id} {job.status}: {job.url}")
+            self._queue.task_done()
+            self._prune_jobs()
+
+
+    def _prune_jobs(self) -> None:
+        """Forget old finished jobs, so a long running daemon does not grow"""
+        now = time.time()
+        finished = sorted(
+            (job.finished, job.id)
+            for job in self.jobs.values()
+            if job.finished is not None
+        )
+        excess = len(finished) - MAX_FINISHED_JOBS
+        for index, (finished_time, job_id) in enumerate(finished):
+            if index < excess or now - finished_time > FINISHED_JOB_TTL:
+                del self.jobs[job_id]
+
+
+    async def _authenticate(self, url: str, source: Source) -> None:
+        """
+        Authenticate with credentials from config file or cookie file.
+        Unlike the cli, the daemon never prompts for credentials.
+
+        :param url: Url being downloaded
+        :param source: Source to authenticate
+        """
+        async with self._auth_lock:
+            if source.authenticated:
+                return
+            source_config = self.config.sources.get(source.name.lower().replace(" ", ""))
+            if source.supports_login and source_config and source_config.username and source_config.password:
+                await source.login(url, source_config.username, source_config.password)
+                source.authenticated = True
+            if not source.authenticated and source.supports_cookies and self.cookie_file:
+                source.load_cookies(self.cookie_file)
+            if not source.authenticated:
+                raise SourceNotAuthenticated
+
+
+    async def _run_job(self, job: Job) -> None:
+        source: Source = load_source(job.url)
+        job.source = source.name
+        if not source.authenticated and source.requires_authentication:
+            with metrics.phase("authenticate"):
+                await self._authenticate(job.url, source)
+        with metrics.phase("metadata"):
+            result = await source.download(job.url)
+        if isinstance(result, Book):
+            job.title = result.metadata.title
+            job.books_total = 1
+            template = job.output or self.default_output or "{title}.{ext}"
+            await self._download_book(job, result, template, job.url)
+        elif isinstance(result, Series):
+            job.title = result.title
+            job.books_total = len(result.book_ids)
+            template = job.output or self.default_output or "{series}/{title}.{ext}"
+            for book_id in result.book_ids:
+                try:
+                    with metrics.phase("metadata"):
+                        book: Book = await source.download_book_from_id(book_id)
+                    await self._download_book(job, book, template, catalog.id_key(book_id))
+                except AccessDenied:
+                    job.books_skipped += 1
+                    job.books_done += 1
+
+
+    async def _download_book(self, job: Job, book: Book, template: str, book_id: str) -> None:
+        book_progress = 0.
+        def update(fraction: float) -> None:
+            nonlocal book_progress
+            book_progress = min(book_progress + fraction, 1.)
+            job.progress = (job.books_done + book_progress) / job.books_total
+        # Metadata can contain "..", so the formatted path is checked too
+        location = format_output_location(book, get_output_format(book, template, self._client), template)
+        root = template_root(template)
+        if not is_inside(location, root):
+            raise ValueError(f"Output path {location} is outside of {root or 'the working directory'}")
+        with tracing.span(book.metadata.title, "book"):
+            await download_book(book, update, template, self._client, job.source, book_id)
+        job.books_done += 1
+        job.progress = job.books_done / job.books_total
+
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, Any]:
+        """
+        Handle api request
+
+        :param method: Http method
+        :param path: Path of request
+        :param body: Request body
+        :returns: Status code and response (json serializable or str)
+        """
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if parts == ["jobs"] and method == "GET":
+            return 200, [asdict(job) for job in self.jobs.values()]
+        if parts == ["jobs"] and method == "POST":
+            try:
+                request = json.loads(body)
+            except ValueError:
+                raise HttpError(400, "Invalid json")
+            if not isinstance(request, dict) or not isinstance(request.get("url"), str):
+                raise HttpError(400, "Missing url")
+            output = request.get("output")
+            if output is not None and not (isinstance(output, str) and is_safe_template(output)):
+                # Clients can only write below the working directory of
+                # the daemon
+                raise HttpError(400, "Output must be a relative path without ..")
+            job = self.submit(request["url"], output)
+            return 201, asdict(job)
+        if len(parts) == 2 and parts[0] == "jobs" and method == "GET":
+            found = self.jobs.get(int(parts[1])) if parts[1].isdigit() else None
+            if found is None:
+                raise HttpError(404, "Unknown job")
+            return 200, asdict(found)
+        if parts == ["metrics"] and method == "GET":
+            return 200, metrics.to_prometheus()
+        raise HttpError(404, "Not found")
+
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve a single http request"""
+        try:
+            try:
+                method, path, body = await read_request(reader)
+                status, response = self.handle(method, path, body)
+            except HttpError as error:
+                status, response = error.status, { "error": error.message }
+            if isinstance(response, str):
+                content, content_type = response.encode("utf8"), "text/plain; version=0.0.4"
+            else:
+                content, content_type = json.dumps(response).encode("utf8"), "application/json"
+            writer.write(
+                f"HTTP/1.1 {status} {httpx.codes.get_reason_phrase(status)}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin1") + content
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def is_safe_template(template: str) -> bool:
+    """Is output template relative and without parent directory references"""
+    if os.path.isabs(template) or os.path.splitdrive(template)[0]:
+        return False
+    parts = template.replace(os.sep, "/").split("/")
+    return ".." not in parts
+
+
+def template_root(template: str) -> str:
+    """Directory of the part of template before the first field"""
+    return os.path.dirname(template.split("{", 1)[0])
+
+
+def is_inside(location: str, root: str) -> bool:
+    """
+    Is location inside root directory
+
+    :param location: Path of file
+    :param root: Directory. The working directory if empty
+    """
+    root = os.path.abspath(root or ".")
+    return os.path.commonpath([root, os.path.abspath(location)]) == root
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, bytes]:
+    """
+    Read http request from stream
+
+    :returns: Method, path and body of request
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError:
+        raise HttpError(413, "Request too large")
+    request_line, *header_lines = head.decode("latin1").split("\r\n")
+    try:
+        method, path, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Invalid request")
+    headers = {}
+    for line in header_lines:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_REQUEST_SIZE:
+        raise HttpError(413, "Request too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, body
+
+
+async def serve(config: Config, options) -> None:
+    """
+    Start daemon and serve api until cancelled
+
+    :param config: Content of config file
+    :param options: Command line options for serve command
+    """
+    cookie_file = options.cookie_file
+    if cookie_file is None and os.path.exists("./cookies.txt"):
+        cookie_file = "./cookies.txt"
+    daemon = Daemon(config, cookie_file, options.output, options.jobs)
+    if options.socket:
+        server = await asyncio.start_unix_server(daemon.handle_connection, path=options.socket)
+        logging.info(f"Listening on [blue]{options.socket}[/]")
+    else:
+        server = await asyncio.start_server(daemon.handle_connection, options.host, options.port)
+        logging.info(f"Listening on [blue]http://{options.host}:{options.port}[/]")
+    async with server:
+        await asyncio.gather(server.serve_forever(), daemon.run_workers())
@@ -31,3 +31,6 @@ class ThrottleError(GrawlixError):
 
 class AccessDenied(GrawlixError):
     error_file = "access_denied"
+
+class DownloadFailed(GrawlixError):
+    error_file = "download_failed"
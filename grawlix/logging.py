@@ -2,17 +2,21 @@ from grawlix.book import Book
 
 import rich
 from rich.console import Console
-from rich.markup import render
+from rich.markup import escape, render
 from rich.progress import Progress, BarColumn, ProgressColumn, TaskID, SpinnerColumn
 from rich.style import Style
+from rich.table import Table
 
-from typing import Union
+from typing import Union, Callable, Optional, Any
 from dataclasses import dataclass
 import importlib.resources
 
 console = Console(stderr=True)
 
 debug_mode = False
+# Replaces progress bars in worker processes of batch downloads, where
+# progress is forwarded to the parent process
+progress_factory: Optional[Callable[[], Any]] = None
 DEBUG_PREFIX = render("[yellow bold]DEBUG[/]")
 
 
@@ -63,14 +67,19 @@ def progress(category_name: str, source_name: str, count=1) -> Progress:
         console.print(f"Downloading [yellow not bold]{count}[/] books in [blue]{category_name}[/] from [magenta]{source_name}[/]")
     else:
         console.print(f"Downloading [blue bold]{category_name}[/] from [magenta]{source_name}[/]")
-    progress = Progress(
+    if progress_factory is not None:
+        return progress_factory()
+    return progress_bar()
+
+
+def progress_bar() -> Progress:
+    return Progress(
         SpinnerColumn(),
         "{task.description}",
         BarColumn(),
         "[progress.percentage]{task.percentage:>3.0f}%",
         console = console,
     )
-    return progress
 
 
 def add_book(progress: Progress, book: Book) -> TaskID:
@@ -79,3 +88,19 @@ def add_book(progress: Progress, book: Book) -> TaskID:
         total = 1
     )
     return task
+
+
+def print_books(books: list[dict[str, Any]]) -> None:
+    """Print books from catalog as a table on stdout"""
+    table = Table("Source", "Series", "#", "Title", "Released", "Size", "Path", box = None)
+    for book in books:
+        table.add_row(
+            book["source"] or "",
+            book["series"] or "",
+            str(book["series_index"] or ""),
+            f"[blue]{escape(book['title'])}[/]",
+            book["release_date"] or "",
+            f"{book['size'] / 1024**2:.1f}M",
+            escape(book["path"]),
+        )
+    Console().print(table)
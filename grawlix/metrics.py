@@ -0,0 +1,240 @@
+from grawlix import tracing
+
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from typing import Iterator
+import json
+import math
+import time
+
+# Upper bounds (in seconds) of request latency histogram buckets
+LATENCY_BUCKETS: tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., math.inf)
+
+
+@dataclass(slots=True)
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds"""
+    bounds: tuple[float, ...] = LATENCY_BUCKETS
+    counts: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+    sum: float = 0.
+    count: int = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+@dataclass(slots=True)
+class Transfer:
+    """Bytes transferred from a host and time spent transferring them"""
+    bytes: int = 0
+    seconds: float = 0.
+
+    @property
+    def bytes_per_second(self) -> float:
+        if self.seconds == 0:
+            return 0.
+        return self.bytes / self.seconds
+
+
+@dataclass(slots=True)
+class Phase:
+    """Accumulated time spent in a phase of the download"""
+    seconds: float = 0.
+    count: int = 0
+
+
+@dataclass(slots=True)
+class Metrics:
+    """Metrics collected during a run"""
+    latency: dict[str, Histogram] = field(default_factory=dict)
+    responses: dict[tuple[str, int], int] = field(default_factory=dict)
+    transfers: dict[str, Transfer] = field(default_factory=dict)
+    retries: dict[str, int] = field(default_factory=dict)
+    phases: dict[str, Phase] = field(default_factory=dict)
+
+
+metrics = Metrics()
+
+
+def observe_request(host: str, status_code: int, seconds: float) -> None:
+    """
+    Record latency of a http request
+
+    :param host: Host the request was sent to
+    :param status_code: Status code of response
+    :param seconds: Time until response headers were received
+    """
+    metrics.latency.setdefault(host, Histogram()).observe(seconds)
+    key = (host, status_code)
+    metrics.responses[key] = metrics.responses.get(key, 0) + 1
+
+
+def observe_transfer(host: str, size: int, seconds: float) -> None:
+    """
+    Record a completed file transfer
+
+    :param host: Host the file was downloaded from
+    :param size: Size of file in bytes
+    :param seconds: Time spent downloading the file
+    """
+    transfer = metrics.transfers.setdefault(host, Transfer())
+    transfer.bytes += size
+    transfer.seconds += seconds
+
+
+def observe_retry(host: str) -> None:
+    """
+    Record that a request to host was retried
+
+    :param host: Host of retried request
+    """
+    metrics.retries[host] = metrics.retries.get(host, 0) + 1
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Measure time spent inside block as part of phase.
+    Also recorded as a span when tracing is enabled.
+
+    :param name: Name of phase (authenticate, metadata, download, decrypt, write)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        entry = metrics.phases.setdefault(name, Phase())
+        entry.seconds += end - start
+        entry.count += 1
+        tracing.add_span(name, "phase", start, end)
+
+
+def merge(other: Metrics) -> None:
+    """
+    Add metrics collected by another process (ex. a batch worker)
+
+    :param other: Metrics to add
+    """
+    for host, histogram in other.latency.items():
+        merged = metrics.latency.setdefault(host, Histogram(bounds = histogram.bounds))
+        merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+        merged.sum += histogram.sum
+        merged.count += histogram.count
+    for key, count in other.responses.items():
+        metrics.responses[key] = metrics.responses.get(key, 0) + count
+    for host, transfer in other.transfers.items():
+        merged_transfer = metrics.transfers.setdefault(host, Transfer())
+        merged_transfer.bytes += transfer.bytes
+        merged_transfer.seconds += transfer.seconds
+    for host, count in other.retries.items():
+        metrics.retries[host] = metrics.retries.get(host, 0) + count
+    for name, entry in other.phases.items():
+        merged_phase = metrics.phases.setdefault(name, Phase())
+        merged_phase.seconds += entry.seconds
+        merged_phase.count += entry.count
+
+
+def to_json_lines() -> str:
+    """
+    Export metrics as json lines
+
+    :returns: One json object per line
+    """
+    timestamp = time.time()
+    records: list[dict] = []
+    for host, histogram in metrics.latency.items():
+        records.append({
+            "type": "request_latency",
+            "host": host,
+            "buckets": {
+                format_bound(bound): count
+                for bound, count in zip(histogram.bounds, histogram.counts)
+            },
+            "sum": histogram.sum,
+            "count": histogram.count,
+        })
+    for (host, status_code), count in metrics.responses.items():
+        records.append({ "type": "responses", "host": host, "status": status_code, "count": count })
+    for host, transfer in metrics.transfers.items():
+        records.append({
+            "type": "transfer",
+            "host": host,
+            "bytes": transfer.bytes,
+            "seconds": transfer.seconds,
+            "bytes_per_second": transfer.bytes_per_second,
+        })
+    for host, count in metrics.retries.items():
+        records.append({ "type": "retries", "host": host, "count": count })
+    for name, entry in metrics.phases.items():
+        records.append({ "type": "phase", "phase": name, "seconds": entry.seconds, "count": entry.count })
+    return "".join(
+        json.dumps({ "timestamp": timestamp, **record }) + "\n"
+        for record in records
+    )
+
+
+def to_prometheus() -> str:
+    """
+    Export metrics in the Prometheus text exposition format
+
+    :returns: Metrics as Prometheus textfile
+    """
+    lines: list[str] = []
+    def header(name: str, typ: str, description: str) -> None:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {typ}")
+
+    header("grawlix_request_duration_seconds", "histogram", "Time until response headers were received")
+    for host, histogram in metrics.latency.items():
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            lines.append(f'grawlix_request_duration_seconds_bucket{{host="{host}",le="{format_bound(bound)}"}} {count}')
+        lines.append(f'grawlix_request_duration_seconds_sum{{host="{host}"}} {histogram.sum}')
+        lines.append(f'grawlix_request_duration_seconds_count{{host="{host}"}} {histogram.count}')
+    header("grawlix_responses_total", "counter", "Responses by host and status code")
+    for (host, status_code), count in metrics.responses.items():
+        lines.append(f'grawlix_responses_total{{host="{host}",status="{status_code}"}} {count}')
+    header("grawlix_downloaded_bytes_total", "counter", "Bytes downloaded from file transfers")
+    for host, transfer in metrics.transfers.items():
+        lines.append(f'grawlix_downloaded_bytes_total{{host="{host}"}} {transfer.bytes}')
+    header("grawlix_transfer_seconds_total", "counter", "Time spent in file transfers")
+    for host, transfer in metrics.transfers.items():
+        lines.append(f'grawlix_transfer_seconds_total{{host="{host}"}} {transfer.seconds}')
+    header("grawlix_transfer_bytes_per_second", "gauge", "Average file transfer throughput")
+    for host, transfer in metrics.transfers.items():
+        lines.append(f'grawlix_transfer_bytes_per_second{{host="{host}"}} {transfer.bytes_per_second}')
+    header("grawlix_retries_total", "counter", "Retried requests")
+    for host, count in metrics.retries.items():
+        lines.append(f'grawlix_retries_total{{host="{host}"}} {count}')
+    header("grawlix_phase_seconds_total", "counter", "Time spent in each phase")
+    for name, entry in metrics.phases.items():
+        lines.append(f'grawlix_phase_seconds_total{{phase="{name}"}} {entry.seconds}')
+    header("grawlix_phase_count_total", "counter", "Times each phase was entered")
+    for name, entry in metrics.phases.items():
+        lines.append(f'grawlix_phase_count_total{{phase="{name}"}} {entry.count}')
+    return "\n".join(lines) + "\n"
+
+
+def format_bound(bound: float) -> str:
+    """Format histogram bucket bound"""
+    return "+Inf" if bound == math.inf else str(bound)
+
+
+def export(location: str) -> None:
+    """
+    Write metrics to disk.
+    Files ending with `.prom` are written as Prometheus textfiles, everything
+    else as json lines.
+
+    :param location: Path to output file
+    """
+    if location.endswith(".prom"):
+        content = to_prometheus()
+    else:
+        content = to_json_lines()
+    with open(location, "w") as f:
+        f.write(content)
@@ -0,0 +1,120 @@
+from grawlix import metrics, tracing
+from grawlix.scheduler import scheduler, CONTROL
+
+from typing import AsyncIterator, Callable, Optional
+import httpx
+import time
+
+START_TIME_KEY = "grawlix_start_time"
+# Response extension with seconds from when the request got a slot from the
+# scheduler until the response headers were received. Time spent waiting for
+# the slot is left out, so it only depends on the host.
+LATENCY_KEY = "grawlix_latency"
+
+
+def response_latency(response: httpx.Response) -> Optional[float]:
+    """
+    Latency of host for response
+
+    :param response: Response from client created with `create_client`
+    :returns: Seconds until headers were received or None if unknown
+    """
+    return response.extensions.get(LATENCY_KEY)
+
+
+async def _on_request(request: httpx.Request) -> None:
+    request.extensions[START_TIME_KEY] = time.perf_counter()
+
+
+async def _on_response(response: httpx.Response) -> None:
+    request = response.request
+    start = request.extensions.get(START_TIME_KEY)
+    if start is not None:
+        end = time.perf_counter()
+        latency = response_latency(response)
+        metrics.observe_request(request.url.host, response.status_code, latency if latency is not None else end - start)
+        tracing.add_span(
+            "request",
+            "http",
+            start,
+            end,
+            method = request.method,
+            url = str(request.url),
+            status = response.status_code
+        )
+
+
+class ReleasingStream(httpx.AsyncByteStream):
+    """Response body that calls `release` when it is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class ScheduledTransport(httpx.AsyncBaseTransport):
+    """
+    Transport that waits for a slot from the request scheduler before
+    sending a request. The slot is held until the response is closed.
+    """
+
+    def __init__(self, priority: str, **kwargs):
+        """
+        :param priority: Default priority of requests
+        :param kwargs: Arguments passed on to `httpx.AsyncHTTPTransport`
+        """
+        self.priority = priority
+        self._transport = httpx.AsyncHTTPTransport(**kwargs)
+
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        priority = self.priority
+        await scheduler.acquire(priority)
+        granted = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            scheduler.release(priority)
+            raise
+        response.extensions[LATENCY_KEY] = time.perf_counter() - granted
+        assert isinstance(response.stream, httpx.AsyncByteStream)
+        response.stream = ReleasingStream(response.stream, lambda: scheduler.release(priority))
+        return response
+
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def create_client(priority: str = CONTROL, **kwargs) -> httpx.AsyncClient:
+    """
+    Create http client with instrumentation used by sources and output formats
+
+    :param priority: Priority of requests sent with client
+        (`grawlix.scheduler.CONTROL` or `grawlix.scheduler.BULK`)
+    :param kwargs: Arguments passed on to `httpx.AsyncClient`
+    :returns: New http client
+    """
+    return httpx.AsyncClient(
+        transport = ScheduledTransport(priority),
+        event_hooks = {
+            "request": [_on_request],
+            "response": [_on_response],
+        },
+        **kwargs
+    )
@@ -1,38 +1,68 @@
 from grawlix.book import Book, BookData, SingleFile, ImageList, OnlineFile, HtmlFiles, EpubInParts
 from grawlix.exceptions import GrawlixError, UnsupportedOutputFormat
 from grawlix.logging import info
+from grawlix import catalog
 
 from .output_format import OutputFormat
 from .acsm import Acsm
 from .cbz import Cbz
 from .epub import Epub
+from .bandwidth import bandwidth
+from .directory_index import directory_index
+from .postprocess import post_processor
 
-from typing import Callable, Iterable
-from pathlib import Path
+from typing import Callable, Optional
+import httpx
 import os
 import platform
 
-async def download_book(book: Book, update_func: Callable, template: str) -> None:
+async def download_book(book: Book, update_func: Callable, template: str, client: Optional[httpx.AsyncClient] = None, source: Optional[str] = None, book_id: Optional[str] = None) -> Optional[str]:
     """
     Download and write book to disk
 
     :param book: Book to download
+    :param client: Shared http client to download files with
+    :param source: Name of source book is from. Transfers count against the
+        bandwidth share of the source
+    :param book_id: Id of book in source (or url) stored in catalog
+    :returns: Path of output file or None if it already existed
     """
-    _, ext = os.path.splitext(template)
-    ext = ext[1:]
-    if ext in get_valid_extensions():
-        output_format = find_output_format(book, ext)()
-    else:
-        output_format = get_default_format(book)
+    output_format = get_output_format(book, template, client)
     location = format_output_location(book, output_format, template)
-    if not book.overwrite and os.path.exists(location):
+    # Existence is checked against a listing of the directory, which is
+    # read once instead of calling stat for every book
+    if not book.overwrite and directory_index.exists(location):
         info("Skipping - File already exists")
-        return
-    parent = Path(location).parent
-    if not parent.exists():
-        os.makedirs(parent)
-    await output_format.download(book, location, update_func)
+        return None
+    parent = os.path.dirname(location)
+    if parent and not directory_index.directory_exists(parent):
+        os.makedirs(parent, exist_ok = True)
+    with bandwidth.source(source):
+        await output_format.download(book, location, update_func)
     await output_format.close()
+    directory_index.add(location)
+    # Cataloged before hooks run, since they can convert or move the file
+    if catalog.catalog is not None:
+        await catalog.catalog.add(book, location, source, book_id)
+    post_processor.submit(location, output_format.extension)
+    return location
+
+
+def get_output_format(book: Book, template: str, client: Optional[httpx.AsyncClient] = None) -> OutputFormat:
+    """
+    Get output format from extension of template or the default format of
+    book if template does not have a known extension
+
+    :param book: Book to download
+    :param template: Template for output path
+    :param client: Shared http client passed on to output format
+    :returns: OutputFormat object
+    """
+    _, ext = os.path.splitext(template)
+    ext = ext[1:]
+    if ext in get_valid_extensions():
+        return find_output_format(book, ext)(client)
+    return get_default_format(book, client)
 
 
 def format_output_location(book: Book, output_format: OutputFormat, template: str) -> str:
@@ -49,17 +79,12 @@ def format_output_location(book: Book, output_format: OutputFormat, template: st
     return path
 
 
-def remove_strings(input: str, strings: Iterable[str]) -> str:
-    """
-    Remove strings from input
-
-    :param input: the string to remove strings from
-    :param strings: the list of strings to remove from input
-    :returns: input without strinfs
-    """
-    for c in strings:
-        input = input.replace(c, "")
-    return input
+# Platform does not change while running, so the table of unsupported chars
+# is only created once
+if platform.system() == "Windows":
+    UNWANTED_CHARS = str.maketrans("", "", "<>:\"/\\|?*")
+else:
+    UNWANTED_CHARS = str.maketrans("", "", "/")
 
 
 def remove_unwanted_chars(input: str) -> str:
@@ -69,18 +94,16 @@ def remove_unwanted_chars(input: str) -> str:
     :param input: The string to remove chars from
     :returns: input without unsupported chars
     """
-    if platform.system() == "Windows":
-        return remove_strings(input, "<>:\"/\\|?*")
-    else:
-        return remove_strings(input, "/")
+    return input.translate(UNWANTED_CHARS)
 
 
-def get_default_format(book: Book) -> OutputFormat:
+def get_default_format(book: Book, client: Optional[httpx.AsyncClient] = None) -> OutputFormat:
     """
     Get default output format for bookdata.
     Should only be used if no format was specified by the user
 
     :param book: Content of book
+    :param client: Shared http client passed on to output format
     :returns: OutputFormat object matching the default
     """
     bookdata = book.data
@@ -91,7 +114,7 @@ def get_default_format(book: Book) -> OutputFormat:
     elif isinstance(bookdata, HtmlFiles) or isinstance(bookdata, EpubInParts):
         extension = "epub"
     output_format = find_output_format(book, extension)
-    return output_format()
+    return output_format(client)
 
 
 def find_output_format(book: Book, extension: str) -> type[OutputFormat]:
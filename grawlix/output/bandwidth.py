@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+import asyncio
+import time
+
+DEFAULT_WEIGHT = 1.
+
+# Name of source the current download belongs to. Set for the duration of
+# `download_book` and inherited by tasks created inside it.
+current_source: ContextVar[Optional[str]] = ContextVar("current_source", default = None)
+
+
+class TokenBucket:
+    """
+    Token bucket where every token is a byte. Up to `burst` bytes can be
+    transferred at once after a pause, after which transfers are held at
+    `rate` bytes per second.
+
+    Consumers take their tokens right away, even if it puts the bucket in
+    debt, and sleep until the debt is paid. Waiting is therefore first come
+    first served, and chunks larger than the burst size still get through.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        """
+        :param rate: Bytes per second
+        :param burst: Maximum number of bytes saved up while idle
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+    def set_rate(self, rate: float) -> None:
+        """Change rate without losing tokens gathered at the old rate"""
+        self._refill()
+        self.rate = rate
+
+
+    def take(self, size: int) -> float:
+        """
+        Take `size` tokens
+
+        :returns: Seconds to wait before the bytes may be transferred
+        """
+        self._refill()
+        self._tokens -= size
+        if self._tokens >= 0:
+            return 0.
+        return -self._tokens / self.rate
+
+
+class BandwidthLimiter:
+    """
+    Limits the combined download rate of all transfers in the process.
+
+    Sources can be given weights. While several sources are downloading, each
+    of them is limited to its weighted share of the rate. A source downloading
+    alone can use all of it.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None, weights: Optional[dict[str, float]] = None):
+        """
+        :param rate: Maximum bytes per second. No limit if None
+        :param burst: Bytes that can be transferred at once after a pause.
+            Defaults to one second at the full rate
+        :param weights: Share of the rate by source name. Sources not listed
+            have weight 1
+        """
+        self.weights = weights or {}
+        # Number of books being downloaded by source
+        self._active: dict[str, int] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self.configure(rate, burst)
+
+
+    def configure(self, rate: Optional[float], burst: Optional[float] = None) -> None:
+        """Set global rate and burst size"""
+        self.rate = rate
+        self.burst = burst
+        self._global = TokenBucket(rate, self._burst_size(rate)) if rate else None
+        self._buckets.clear()
+
+
+    def _burst_size(self, rate: float) -> float:
+        return self.burst or rate
+
+
+    def _weight(self, source: str) -> float:
+        # Weights use the same source names as the config file
+        return self.weights.get(source.lower().replace(" ", ""), DEFAULT_WEIGHT)
+
+
+    def _source_bucket(self, source: str) -> TokenBucket:
+        """Bucket of source with rate set to its current share"""
+        assert self.rate is not None
+        total_weight = sum(self._weight(name) for name in self._active)
+        rate = self.rate * self._weight(source) / total_weight
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            bucket = TokenBucket(rate, self._burst_size(rate))
+            self._buckets[source] = bucket
+        else:
+            bucket.set_rate(rate)
+        return bucket
+
+
+    @contextmanager
+    def source(self, source: Optional[str]) -> Iterator[None]:
+        """
+        Count transfers inside block against the share of `source`. The
+        source takes part in splitting the rate until the block exits.
+
+        :param source: Name of source
+        """
+        if source is None:
+            yield
+            return
+        self._active[source] = self._active.get(source, 0) + 1
+        token = current_source.set(source)
+        try:
+            yield
+        finally:
+            current_source.reset(token)
+            self._active[source] -= 1
+            if self._active[source] == 0:
+                del self._active[source]
+
+
+    async def consume(self, size: int) -> None:
+        """
+        Wait until `size` bytes may be transferred. Counts against the share
+        of the source in `current_source`
+
+        :param size: Number of bytes transferred
+        """
+        if self._global is None:
+            return
+        delay = self._global.take(size)
+        source = current_source.get()
+        if source in self._active and len(self.weights) > 0:
+            delay = max(delay, self._source_bucket(source).take(size))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Shared by all downloads in the process
+bandwidth = BandwidthLimiter()
@@ -0,0 +1,134 @@
+from contextlib import asynccontextmanager
+from collections import deque
+from typing import AsyncIterator, Optional
+import asyncio
+
+# Reserved for downloads where the server does not send a Content-Length
+UNKNOWN_SIZE_RESERVATION = 8 * 1024 * 1024
+
+
+class ByteBudget:
+    """
+    Limits the number of bytes held in memory by concurrent downloads.
+    Reservations are granted in the order they were requested, so large files
+    are not starved by a steady stream of small ones.
+    """
+
+    def __init__(self, limit: Optional[int] = None):
+        """
+        :param limit: Maximum number of bytes in flight. No limit if None
+        """
+        self.limit = limit
+        self._used = 0
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+
+
+    @property
+    def used(self) -> int:
+        """Number of bytes currently reserved"""
+        return self._used
+
+
+    def _clamp(self, size: int) -> int:
+        """Files larger than the whole budget reserve all of it"""
+        if self.limit is None:
+            return size
+        return min(size, self.limit)
+
+
+    def _fits(self, size: int) -> bool:
+        return self.limit is None or self._used == 0 or self._used + size <= self.limit
+
+
+    def _wake_waiters(self) -> None:
+        while self._waiters:
+            size, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(size):
+                break
+            self._waiters.popleft()
+            self._used += size
+            future.set_result(None)
+
+
+    async def acquire(self, size: int) -> int:
+        """
+        Wait until `size` bytes are available and reserve them
+
+        :param size: Number of bytes to reserve
+        :returns: Number of bytes actually reserved. Should be passed to `release`
+        """
+        size = self._clamp(size)
+        if not self._waiters and self._fits(size):
+            self._used += size
+            return size
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((size, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(size)
+            raise
+        return size
+
+
+    def release(self, size: int) -> None:
+        """
+        Release reserved bytes
+
+        :param size: Value returned from `acquire`
+        """
+        self._used -= size
+        self._wake_waiters()
+
+
+    @asynccontextmanager
+    async def reservation(self) -> AsyncIterator["Reservation"]:
+        """Empty reservation that is released when the block exits"""
+        reservation = Reservation(self)
+        try:
+            yield reservation
+        finally:
+            reservation.release()
+
+
+class Reservation:
+    """
+    Bytes reserved by a single download. Resized when the size of the
+    download becomes known.
+    """
+
+    def __init__(self, budget: ByteBudget) -> None:
+        self._budget = budget
+        self.size = 0
+
+
+    async def resize(self, size: int) -> None:
+        """
+        Change number of reserved bytes. Waits if more bytes are needed
+
+        :param size: Expected number of bytes
+        """
+        size = self._budget._clamp(size)
+        if size <= self.size:
+            self._budget.release(self.size - size)
+            self.size = size
+            return
+        # Waiting for more bytes while holding some could deadlock with other
+        # downloads doing the same, so the whole reservation waits in line
+        # again
+        self.release()
+        self.size = await self._budget.acquire(size)
+
+
+    def release(self) -> None:
+        """Release all reserved bytes"""
+        self._budget.release(self.size)
+        self.size = 0
+
+
+# Shared by all downloads in the process
+budget = ByteBudget()
@@ -0,0 +1,153 @@
+from grawlix.book import OnlineFile
+from .staging import write_file_atomic
+
+from hashlib import sha256
+from typing import Optional
+import appdirs
+import os
+import threading
+
+
+class FileCache:
+    """
+    Content addressed on-disk cache of downloaded (and decrypted) files.
+
+    Content is stored once per sha256 digest in `blobs/`. Files are looked up
+    by their identity (`OnlineFile.cache_key` or url) through small files in
+    `keys/` containing the digest of their content. When the total size of
+    blobs exceeds the limit, the least recently used blobs are removed.
+
+    Files are read and written from worker threads, so the event loop is not
+    blocked by disk access.
+    """
+
+    def __init__(self, directory: str, max_size: int):
+        """
+        :param directory: Directory to store cache in
+        :param max_size: Maximum total size of cached files in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self._blob_directory = os.path.join(directory, "blobs")
+        self._key_directory = os.path.join(directory, "keys")
+        os.makedirs(self._blob_directory, exist_ok=True)
+        os.makedirs(self._key_directory, exist_ok=True)
+        self._size: Optional[int] = None
+        # Held while blobs are added or removed
+        self._lock = threading.RLock()
+
+
+    @staticmethod
+    def file_identity(file: OnlineFile) -> str:
+        """
+        Stable identity of file. Sources set `cache_key` when urls are signed
+        or otherwise change between downloads.
+
+        :param file: File to identify
+        :returns: Identity used as cache key
+        """
+        return file.cache_key or file.url
+
+
+    def _key_path(self, identity: str) -> str:
+        return os.path.join(self._key_directory, sha256(identity.encode("utf8")).hexdigest())
+
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self._blob_directory, digest[:2], digest)
+
+
+    def get(self, file: OnlineFile) -> Optional[bytes]:
+        """
+        Read file from cache
+
+        :param file: File to look up
+        :returns: Content of file or None if file is not cached
+        """
+        key_path = self._key_path(self.file_identity(file))
+        try:
+            with open(key_path, "r") as f:
+                digest = f.read().strip()
+            blob_path = self._blob_path(digest)
+            with open(blob_path, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        if sha256(content).hexdigest() != digest:
+            # Damaged blob
+            with self._lock:
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+            return None
+        try:
+            # Modification time is used to find least recently used blobs
+            os.utime(blob_path)
+        except FileNotFoundError:
+            # Evicted after it was read
+            pass
+        return content
+
+
+    def put(self, file: OnlineFile, content: bytes) -> None:
+        """
+        Store file in cache
+
+        :param file: File being stored
+        :param content: Content of file
+        """
+        if len(content) > self.max_size:
+            return
+        digest = sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+        with self._lock:
+            if os.path.exists(blob_path):
+                os.utime(blob_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                write_file_atomic(blob_path, content)
+                self._size = self.size + len(content)
+            write_file_atomic(self._key_path(self.file_identity(file)), digest.encode("utf8"))
+            if self.size > self.max_size:
+                self.evict(self.max_size)
+
+
+    @property
+    def size(self) -> int:
+        """Total size of cached blobs"""
+        if self._size is None:
+            self._size = sum(entry.stat().st_size for entry in self._blobs())
+        return self._size
+
+
+    def _blobs(self) -> list[os.DirEntry]:
+        blobs: list[os.DirEntry] = []
+        for prefix in os.scandir(self._blob_directory):
+            if prefix.is_dir():
+                blobs.extend(entry for entry in os.scandir(prefix.path) if entry.is_file())
+        return blobs
+
+
+    def evict(self, max_size: int) -> None:
+        """
+        Remove least recently used blobs until cache is at most `max_size`.
+        Keys pointing to removed blobs are treated as missing on lookup.
+
+        :param max_size: Size to shrink cache to
+        """
+        with self._lock:
+            blobs = sorted(self._blobs(), key = lambda entry: entry.stat().st_mtime)
+            size = sum(entry.stat().st_size for entry in blobs)
+            for entry in blobs:
+                if size <= max_size:
+                    break
+                size -= entry.stat().st_size
+                os.remove(entry.path)
+            self._size = size
+
+
+def default_cache_directory() -> str:
+    return os.path.join(appdirs.user_cache_dir("grawlix", "jo1gi"), "files")
+
+
+# Cache used by output formats. Disabled unless set
+file_cache: Optional[FileCache] = None
@@ -2,8 +2,10 @@ from .output_format import OutputFormat, Update, Book
 from grawlix.book import ImageList, OnlineFile
 from grawlix.exceptions import UnsupportedOutputFormat
 from .metadata.comicinfo import to_comic_info
+from .staging import Staging, atomic_location
+from .zip_writer import ZipWriter
+from grawlix import metrics, tracing
 
-from zipfile import ZipFile
 import asyncio
 import math
 
@@ -16,20 +18,36 @@ class Cbz(OutputFormat):
     async def download(self, book: Book, location: str, update: Update) -> None:
         if not isinstance(book.data, ImageList):
             raise UnsupportedOutputFormat
-        semaphore = asyncio.Semaphore(10)
         images = book.data.images
         image_count = len(images)
-        with ZipFile(location, mode="w") as zip:
-            async def download_page(index: int, file: OnlineFile):
-                async with semaphore:
-                    content = await self._download_file(file)
-                    padded_index = str(index).zfill(math.ceil(math.log10(image_count)))
-                    zip.writestr(f"Image {padded_index}.{file.extension}", content)
-                    if update:
-                        update(1/image_count)
-            tasks = [
-                asyncio.create_task(download_page(index, file))
-                for index, file in enumerate(images)
-            ]
-            await asyncio.wait(tasks)
-            zip.writestr("ComicInfo.xml", to_comic_info(book.metadata))
+        # Pages are stored next to the output until every page is downloaded,
+        # so an interrupted download continues where it stopped
+        staging = Staging(location)
+
+        def page_name(index: int, file: OnlineFile) -> str:
+            padded_index = str(index).zfill(math.ceil(math.log10(image_count)))
+            return f"Image {padded_index}.{file.extension}"
+
+        async def download_page(index: int, file: OnlineFile):
+            name = page_name(index, file)
+            # Concurrent requests to the host are limited by its adaptive
+            # limiter (see `limiter.py`)
+            if name not in staging:
+                with tracing.span("page", "page", index = index):
+                    async with self._download_file(file) as content:
+                        with metrics.phase("write"):
+                            staging.write(name, content)
+            if update:
+                update(1/image_count)
+
+        await asyncio.gather(*[
+            download_page(index, file)
+            for index, file in enumerate(images)
+        ])
+        with metrics.phase("write"), atomic_location(location) as temporary:
+            async with ZipWriter(temporary) as zip:
+                for index, file in enumerate(images):
+                    name = page_name(index, file)
+                    await zip.write(name, staging.read(name))
+                await zip.write("ComicInfo.xml", to_comic_info(book.metadata).encode("utf8"))
+        staging.remove()
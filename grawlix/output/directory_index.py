@@ -0,0 +1,78 @@
+from typing import Optional
+import os
+import time
+
+# Listings older than this are read again, so long running processes (serve,
+# watch) notice files changed by others
+MAX_LISTING_AGE = 60
+
+
+class DirectoryIndex:
+    """
+    Names of files in output directories. Each directory is listed with a
+    single scandir, so checking whether books already exist does not cost a
+    stat call per book (which is slow on network filesystems).
+    """
+
+    def __init__(self) -> None:
+        # Directory -> (time of listing, names in directory or None if the
+        # directory does not exist)
+        self._listings: dict[str, tuple[float, Optional[set[str]]]] = {}
+
+
+    def _listing(self, directory: str) -> Optional[set[str]]:
+        now = time.monotonic()
+        if directory in self._listings:
+            listed, names = self._listings[directory]
+            if now - listed < MAX_LISTING_AGE:
+                return names
+        try:
+            with os.scandir(directory) as entries:
+                names = { entry.name for entry in entries }
+        except (FileNotFoundError, NotADirectoryError):
+            names = None
+        self._listings[directory] = (now, names)
+        return names
+
+
+    @staticmethod
+    def _split(path: str) -> tuple[str, str]:
+        directory, name = os.path.split(os.path.normpath(path))
+        return directory or ".", name
+
+
+    def exists(self, path: str) -> bool:
+        """
+        Check if file exists
+
+        :param path: Path of file
+        """
+        directory, name = self._split(path)
+        names = self._listing(directory)
+        return names is not None and name in names
+
+
+    def directory_exists(self, directory: str) -> bool:
+        """
+        Check if directory exists
+
+        :param directory: Path of directory
+        """
+        return self._listing(os.path.normpath(directory)) is not None
+
+
+    def add(self, path: str) -> None:
+        """
+        Record file as created
+
+        :param path: Path of created file
+        """
+        directory, name = self._split(path)
+        names = self._listing(directory)
+        if names is None:
+            names = set()
+            self._listings[directory] = (time.monotonic(), names)
+        names.add(name)
+
+
+directory_index = DirectoryIndex()
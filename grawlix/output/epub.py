@@ -1,13 +1,17 @@
 from grawlix.book import HtmlFiles, HtmlFile, OnlineFile, Book, SingleFile, Metadata, EpubInParts
-from grawlix.exceptions import UnsupportedOutputFormat
+from grawlix.exceptions import UnsupportedOutputFormat, DataNotFound
 from .output_format import OutputFormat, Update
+from .staging import Staging, atomic_location
+from .epub_writer import EpubWriter, xhtml_document, xhtml_fragment
+from grawlix import logging, metrics, tracing
 
 import asyncio
 from bs4 import BeautifulSoup
-import os
-from ebooklib import epub
-from zipfile import ZipFile
-import rich
+from hashlib import sha256
+from typing import Optional
+import posixpath
+import re
+from zipfile import ZipFile, ZipInfo
 
 class Epub(OutputFormat):
     extension = "epub"
@@ -26,113 +30,197 @@ class Epub(OutputFormat):
 
 
     async def _download_html_files(self, html: HtmlFiles, metadata: Metadata, location: str, update: Update) -> None:
-        output = epub.EpubBook()
-        output.set_title(metadata.title)
-        for author in metadata.authors:
-            output.add_author(author)
         file_count = len(html.htmlfiles) + 1 # Html files + cover
-
-        async def download_cover(cover_file: OnlineFile):
-            cover_filename = f"cover.{cover_file.extension}"
-            epub_cover = epub.EpubCover(file_name = cover_filename)
-            epub_cover.content = await self._download_file(cover_file)
-            output.add_item(epub_cover)
-            epub_cover_page = epub.EpubCoverHtml(image_name = cover_filename)
-            if update:
-                update(1/file_count)
-            return epub_cover_page
-
-
-        async def download_file(index: int, file: HtmlFile):
-            response = await self._client.get(
-                file.file.url,
-                headers = file.file.headers,
-                cookies = file.file.cookies,
-                follow_redirects=True
-            )
-            soup = BeautifulSoup(response.text, "lxml")
-            selected_element = soup.find(attrs=file.selector)
-            epub_file = epub.EpubHtml(
-                title = file.title,
-                file_name = f"part {index}.html",
-                content = str(selected_element)
-            )
-            if update:
-                update(1/file_count)
-            return epub_file
-
-        # Download files
-        tasks = [
-            download_file(index, file)
-            for index, file in enumerate(html.htmlfiles)
-        ]
-        if html.cover:
-            tasks.append(download_cover(html.cover))
-        epub_files = await asyncio.gather(*tasks)
-
-        # Add files to epub
-        for epub_file in epub_files:
-            output.add_item(epub_file)
-            output.spine.append(epub_file)
-            output.toc.append(epub_file)
-
-        # Complete book
-        output.add_item(epub.EpubNcx())
-        output.add_item(epub.EpubNav())
-        epub.write_epub(location, output)
+        # Files are written to the epub as soon as they are downloaded, so
+        # the book is never held in memory at once
+        with atomic_location(location) as temporary:
+            async with EpubWriter(temporary, metadata) as output:
+
+                async def download_cover(cover_file: OnlineFile):
+                    async with self._download_file(cover_file) as content:
+                        with metrics.phase("write"):
+                            await output.add_cover(f"cover.{cover_file.extension}", content)
+                    if update:
+                        update(1/file_count)
+
+
+                async def download_file(index: int, file: HtmlFile):
+                    # Chapters use the same cache and per host limits as
+                    # other files
+                    async with self._download_file(file.file) as content:
+                        with tracing.span("parse", "html", url = file.file.url):
+                            soup = BeautifulSoup(content, "lxml")
+                    selected_element = soup.find(attrs=file.selector)
+                    if selected_element is None:
+                        # Layout of the page has changed
+                        logging.debug(f"Content of {file.file.url} not found with {file.selector}")
+                        raise DataNotFound
+                    # Chapters are stored as xhtml, so the html of the page
+                    # is serialized as xml
+                    body = xhtml_fragment(str(selected_element))
+                    with metrics.phase("write"):
+                        await output.add_document(
+                            f"part{index}.xhtml",
+                            xhtml_document(file.title, body),
+                            title = file.title,
+                            in_toc = True,
+                            order = index,
+                        )
+                    if update:
+                        update(1/file_count)
+
+                # Download files
+                tasks = [
+                    asyncio.create_task(download_file(index, file))
+                    for index, file in enumerate(html.htmlfiles)
+                ]
+                if html.cover:
+                    tasks.append(asyncio.create_task(download_cover(html.cover)))
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    # Remaining downloads would otherwise write to a closed file
+                    for task in tasks:
+                        task.cancel()
+                    raise
 
 
     async def _download_epub_in_parts(self, data: EpubInParts, metadata: Metadata, location: str, update: Update) -> None:
         files = data.files
         file_count = len(files)
         progress = 1/(file_count)
-        temporary_file_location = f"{location}.tmp"
-
-        added_files: set[str] = set()
-        def get_new_files(zipfile: ZipFile):
-            """Returns files in zipfile not already added to file"""
-            for filename in zipfile.namelist():
-                if filename in added_files or filename.endswith(".opf") or filename.endswith(".ncx"):
-                    continue
-                yield filename
-
-        output = epub.EpubBook()
-        for file in files:
-            await self._download_and_write_file(file, temporary_file_location)
-            with ZipFile(temporary_file_location, "r") as zipfile:
-                for filepath in get_new_files(zipfile):
-                    content = zipfile.read(filepath)
-                    if filepath.endswith("html"):
-                        filename = os.path.basename(filepath)
-                        is_in_toc = False
-                        title = None
-                        for key, value in data.files_in_toc.items():
-                            toc_filename = key.split("#")[0]
-                            if filename == toc_filename:
-                                title = value
-                                is_in_toc = True
-                                break
-                        epub_file = epub.EpubHtml(
-                            title = title,
-                            file_name = filepath,
-                            content = content
-                        )
-                        output.add_item(epub_file)
-                        output.spine.append(epub_file)
-                        if is_in_toc:
-                            output.toc.append(epub_file)
-                    else:
-                        epub_file = epub.EpubItem(
-                            file_name = filepath,
-                            content = content
-                        )
-                        output.add_item(epub_file)
-                    added_files.add(filepath)
-            if update:
-                update(progress)
-        os.remove(temporary_file_location)
-
-        output.add_item(epub.EpubNcx())
-        output.add_item(epub.EpubNav())
-        epub.write_epub(location, output)
-        exit()
+        # Decrypted parts are kept until the book is complete, so an
+        # interrupted download continues with the parts already downloaded
+        staging = Staging(location)
+
+        with atomic_location(location) as temporary:
+            async with EpubWriter(temporary, metadata) as output:
+                merger = PartMerger(output, data.files_in_toc)
+                for index, file in enumerate(files):
+                    part_name = f"part {index}.epub"
+                    if part_name not in staging:
+                        async with self._download_file(file) as content:
+                            staging.write(part_name, content)
+                    with ZipFile(staging.path(part_name), "r") as zipfile, metrics.phase("write"):
+                        await merger.add_part(zipfile)
+                    if update:
+                        update(progress)
+            logging.debug(f"Skipped {merger.skipped} repeated files in parts, stored {len(merger.aliases)} identical files once")
+        staging.remove()
+
+
+# Files from parts that are not copied to the merged epub
+IGNORED_PART_FILES = re.compile(r"^(mimetype|META-INF/.*|.*\.opf|.*\.ncx|.*/)$")
+# References to files in html and css
+REFERENCE = r"""(?<=["'(])({})(?=[#?"')])"""
+
+
+class PartMerger:
+    """
+    Copies files from parts of an epub into a single epub.
+
+    Parts repeat the same fonts, stylesheets and images. Sizes and checksums
+    from the zip directory find files that may be repeated, and their
+    content is compared before they are treated as the same file. Files
+    already in the output (by name or content) are skipped, and references
+    to identical files stored under another name are rewritten to the
+    stored copy.
+    """
+
+    def __init__(self, output: EpubWriter, files_in_toc: dict[str, str]):
+        """
+        :param output: Epub being written
+        :param files_in_toc: Titles of files in table of contents by filename
+        """
+        self.output = output
+        self.titles = {
+            key.split("#")[0]: title
+            for key, title in reversed(files_in_toc.items())
+        }
+        # Path and sha256 digest of stored file by checksum and size
+        self._stored: dict[tuple[int, int], tuple[str, bytes]] = {}
+        # Paths of repeated files to stored file with same content
+        self.aliases: dict[str, str] = {}
+        self.skipped = 0
+
+
+    async def add_part(self, part: ZipFile) -> None:
+        """Copy new files in part to output"""
+        documents = []
+        for info in part.infolist():
+            name = info.filename
+            if IGNORED_PART_FILES.match(name):
+                continue
+            if name in self.output or name in self.aliases:
+                self.skipped += 1
+                continue
+            # Resources are added before html and css in the part, so
+            # references to repeated resources are known when those are
+            # rewritten
+            if is_document(name) or name.endswith(".css"):
+                documents.append(info)
+                continue
+            content = part.read(info)
+            digest = sha256(content).digest()
+            stored = self._stored_copy(info, digest)
+            if stored is not None:
+                self.aliases[name] = stored
+                continue
+            await self.output.add_file(name, content)
+            self._stored.setdefault((info.CRC, info.file_size), (name, digest))
+        for info in documents:
+            await self._add_document(part, info)
+
+
+    def _stored_copy(self, info: ZipInfo, digest: bytes) -> Optional[str]:
+        """
+        Path of stored file with the same content as file in part
+
+        :param info: File in part
+        :param digest: Sha256 digest of file content
+        """
+        stored = self._stored.get((info.CRC, info.file_size))
+        # Crc32 is easy to collide, so matching entries are only candidates
+        if stored is not None and stored[1] == digest:
+            return stored[0]
+        return None
+
+
+    async def _add_document(self, part: ZipFile, info: ZipInfo) -> None:
+        name = info.filename
+        content = part.read(info)
+        if name.endswith(".css"):
+            digest = sha256(content).digest()
+            stored = self._stored_copy(info, digest)
+            # Urls in stylesheets are relative to the stylesheet, so only
+            # copies in the same directory can be shared
+            if stored is not None and posixpath.dirname(stored) == posixpath.dirname(name):
+                self.aliases[name] = stored
+                return
+            await self.output.add_file(name, self._rewrite_references(name, content))
+            self._stored.setdefault((info.CRC, info.file_size), (name, digest))
+        else:
+            content = self._rewrite_references(name, content)
+            title = self.titles.get(posixpath.basename(name))
+            await self.output.add_document(name, content, title = title, in_toc = title is not None)
+
+
+    def _rewrite_references(self, name: str, content: bytes) -> bytes:
+        """Point references to repeated files to the stored copy"""
+        if not self.aliases:
+            return content
+        directory = posixpath.dirname(name)
+        replacements = {
+            posixpath.relpath(alias, directory or "."): posixpath.relpath(stored, directory or ".")
+            for alias, stored in self.aliases.items()
+        }
+        # Only paths that are present in the content are interesting
+        present = [path for path in replacements if path.encode("utf8") in content]
+        if not present:
+            return content
+        pattern = re.compile(REFERENCE.format("|".join(re.escape(path) for path in present)).encode("utf8"))
+        return pattern.sub(lambda match: replacements[match.group(1).decode("utf8")].encode("utf8"), content)
+
+
+def is_document(name: str) -> bool:
+    return name.endswith("html")
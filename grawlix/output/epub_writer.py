@@ -0,0 +1,269 @@
+from grawlix.book import Metadata
+from .zip_writer import ZipWriter, media_type
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+from lxml import etree
+from xml.sax.saxutils import escape, quoteattr
+import lxml.html
+import posixpath
+import re
+import uuid
+
+# Content is stored in this directory inside the epub, next to the package
+# document
+CONTENT_DIRECTORY = "EPUB"
+
+# Attribute names allowed in xml. Html parsers accept more (ex. "@click")
+XML_ATTRIBUTE_NAME = re.compile(r"^(xml:)?[A-Za-z_][\w.\-]*$")
+
+CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="EPUB/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+
+@dataclass(slots=True)
+class ManifestItem:
+    id: str
+    href: str
+    media_type: str
+    properties: Optional[str] = None
+
+
+@dataclass(slots=True)
+class SpineItem:
+    order: float
+    item: ManifestItem
+    title: Optional[str]
+    in_toc: bool
+
+
+def xhtml_document(title: Optional[str], body: str) -> bytes:
+    """
+    Wrap html in xhtml document
+
+    :param title: Title of document
+    :param body: Content of body element
+    """
+    return (
+        "<?xml version='1.0' encoding='utf-8'?>\n"
+        "<!DOCTYPE html>\n"
+        "<html xmlns=\"http://www.w3.org/1999/xhtml\" xmlns:epub=\"http://www.idpf.org/2007/ops\">\n"
+        f"<head><title>{escape(title or '')}</title></head>\n"
+        f"<body>{body}</body>\n"
+        "</html>\n"
+    ).encode("utf8")
+
+
+def xhtml_fragment(html: str) -> str:
+    """
+    Convert html to well-formed xhtml. Entities are resolved, void elements
+    are closed, text in script and style elements is escaped and attributes
+    that are not valid in xml are removed.
+
+    :param html: Html fragment
+    :returns: Xhtml that can be used as content of body
+    """
+    wrapper = lxml.html.fragment_fromstring(html, create_parent = "div")
+    for element in wrapper.iter(etree.Element):
+        for name in list(element.attrib):
+            if not XML_ATTRIBUTE_NAME.match(name):
+                del element.attrib[name]
+    return escape(wrapper.text or "") + "".join(
+        etree.tostring(child, method = "xml", encoding = "unicode", with_tail = True)
+        for child in wrapper
+    )
+
+
+class EpubWriter:
+    """
+    Writes epub files one entry at a time. Content is written to the zip file
+    as soon as it is added, and only the small package document, ncx and
+    navigation document (written when closed) need information about every
+    file.
+    """
+
+    def __init__(self, location: str, metadata: Metadata):
+        """
+        :param location: Path of epub file
+        :param metadata: Metadata of book
+        """
+        self.metadata = metadata
+        self._zip = ZipWriter(location)
+        self._manifest: list[ManifestItem] = []
+        self._spine: list[SpineItem] = []
+        self._names: set[str] = set()
+        self._cover_image: Optional[ManifestItem] = None
+        self._identifier = metadata.identifier or f"urn:uuid:{uuid.uuid4()}"
+
+
+    async def __aenter__(self) -> "EpubWriter":
+        # Readers expect mimetype as the first entry and uncompressed
+        await self._zip.write("mimetype", b"application/epub+zip", level = 0)
+        return self
+
+
+    async def __aexit__(self, exception_type, *_) -> None:
+        if exception_type is None:
+            await self.close()
+        else:
+            self._zip.abort()
+
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+
+
+    async def add_file(self, name: str, content: bytes, properties: Optional[str] = None) -> ManifestItem:
+        """
+        Write file to epub
+
+        :param name: Path of file relative to content directory
+        :param content: Content of file
+        :param properties: Properties of file in manifest
+        :returns: Manifest entry of file
+        """
+        item = ManifestItem(
+            id = f"item{len(self._manifest)}",
+            href = name,
+            media_type = media_type(name),
+            properties = properties,
+        )
+        # Added before waiting for the zip writer, so files added at the same
+        # time get their own ids
+        self._names.add(name)
+        self._manifest.append(item)
+        await self._zip.write(posixpath.join(CONTENT_DIRECTORY, name), content)
+        return item
+
+
+    async def add_document(self, name: str, content: bytes, title: Optional[str] = None, in_toc: bool = False, order: Optional[float] = None) -> ManifestItem:
+        """
+        Write xhtml document to epub and add it to the reading order
+
+        :param name: Path of file relative to content directory
+        :param content: Complete xhtml document
+        :param title: Title used in table of contents
+        :param in_toc: Add document to table of contents
+        :param order: Position in reading order. Documents are read in the
+            order they are added if not given
+        :returns: Manifest entry of file
+        """
+        item = await self.add_file(name, content)
+        item.media_type = "application/xhtml+xml"
+        self._spine.append(SpineItem(
+            order = len(self._spine) if order is None else order,
+            item = item,
+            title = title,
+            in_toc = in_toc,
+        ))
+        return item
+
+
+    async def add_cover(self, name: str, content: bytes) -> None:
+        """
+        Write cover image and a page showing it at the start of the book
+
+        :param name: Filename of cover image
+        :param content: Image data
+        """
+        self._cover_image = await self.add_file(name, content, properties = "cover-image")
+        page = xhtml_document("Cover", f"<img src={quoteattr(name)} alt=\"Cover\"/>")
+        await self.add_document(self._unique_name("cover.xhtml"), page, order = float("-inf"))
+
+
+    def _unique_name(self, name: str) -> str:
+        """Name that does not collide with files already in epub"""
+        stem, extension = posixpath.splitext(name)
+        index = 1
+        while name in self._names:
+            name = f"{stem}-{index}{extension}"
+            index += 1
+        return name
+
+
+    async def close(self) -> None:
+        """Write navigation, package document and container and close file"""
+        self._spine.sort(key = lambda entry: entry.order)
+        # Table of contents can not be empty
+        toc = [entry for entry in self._spine if entry.in_toc] or self._spine
+        ncx = await self.add_file(self._unique_name("toc.ncx"), self._ncx(toc))
+        await self.add_file(self._unique_name("nav.xhtml"), self._nav(toc), properties = "nav")
+        await self._zip.write(posixpath.join(CONTENT_DIRECTORY, "content.opf"), self._package_document(ncx).encode("utf8"))
+        await self._zip.write("META-INF/container.xml", CONTAINER.encode("utf8"))
+        await self._zip.close()
+
+
+    def _package_document(self, ncx: ManifestItem) -> str:
+        metadata = [
+            f"<dc:identifier id=\"id\">{escape(self._identifier)}</dc:identifier>",
+            f"<dc:title>{escape(self.metadata.title)}</dc:title>",
+            f"<dc:language>{escape(self.metadata.language or 'en')}</dc:language>",
+            *(f"<dc:creator>{escape(author)}</dc:creator>" for author in self.metadata.authors),
+            datetime.now(timezone.utc).strftime("<meta property=\"dcterms:modified\">%Y-%m-%dT%H:%M:%SZ</meta>"),
+        ]
+        if self.metadata.publisher:
+            metadata.append(f"<dc:publisher>{escape(self.metadata.publisher)}</dc:publisher>")
+        if self.metadata.description:
+            metadata.append(f"<dc:description>{escape(self.metadata.description)}</dc:description>")
+        if self.metadata.release_date:
+            metadata.append(f"<dc:date>{self.metadata.release_date.isoformat()}</dc:date>")
+        if self._cover_image:
+            metadata.append(f"<meta name=\"cover\" content=\"{self._cover_image.id}\"/>")
+        manifest = []
+        for item in self._manifest:
+            properties = f" properties=\"{item.properties}\"" if item.properties else ""
+            manifest.append(f"<item id=\"{item.id}\" href={quoteattr(item.href)} media-type=\"{item.media_type}\"{properties}/>")
+        spine = [f"<itemref idref=\"{entry.item.id}\"/>" for entry in self._spine]
+        newline = "\n    "
+        return (
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            "<package xmlns=\"http://www.idpf.org/2007/opf\" version=\"3.0\" unique-identifier=\"id\">\n"
+            "  <metadata xmlns:dc=\"http://purl.org/dc/elements/1.1/\">\n"
+            f"    {newline.join(metadata)}\n"
+            "  </metadata>\n"
+            "  <manifest>\n"
+            f"    {newline.join(manifest)}\n"
+            "  </manifest>\n"
+            f"  <spine toc=\"{ncx.id}\">\n"
+            f"    {newline.join(spine)}\n"
+            "  </spine>\n"
+            "</package>\n"
+        )
+
+
+    def _ncx(self, toc: list[SpineItem]) -> bytes:
+        points = [
+            f"<navPoint id=\"navpoint{index}\">"
+            f"<navLabel><text>{escape(entry.title or entry.item.href)}</text></navLabel>"
+            f"<content src={quoteattr(entry.item.href)}/>"
+            "</navPoint>"
+            for index, entry in enumerate(toc)
+        ]
+        newline = "\n    "
+        return (
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            "<ncx xmlns=\"http://www.daisy.org/z3986/2005/ncx/\" version=\"2005-1\">\n"
+            f"  <head><meta name=\"dtb:uid\" content={quoteattr(self._identifier)}/></head>\n"
+            f"  <docTitle><text>{escape(self.metadata.title)}</text></docTitle>\n"
+            "  <navMap>\n"
+            f"    {newline.join(points)}\n"
+            "  </navMap>\n"
+            "</ncx>\n"
+        ).encode("utf8")
+
+
+    def _nav(self, toc: list[SpineItem]) -> bytes:
+        entries = "".join(
+            f"<li><a href={quoteattr(entry.item.href)}>{escape(entry.title or entry.item.href)}</a></li>"
+            for entry in toc
+        )
+        return xhtml_document(
+            self.metadata.title,
+            f"<nav epub:type=\"toc\" id=\"toc\"><h2>{escape(self.metadata.title)}</h2><ol>{entries}</ol></nav>"
+        )
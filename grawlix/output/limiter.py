@@ -0,0 +1,156 @@
+from grawlix.scheduler import scheduler
+
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import asyncio
+import httpx
+import time
+
+INITIAL_LIMIT = 8
+MIN_LIMIT = 1
+# Also capped by the bulk slots of the request scheduler
+MAX_LIMIT = 64
+# Latency above this multiple of the baseline means the host is queueing
+# requests
+LATENCY_TOLERANCE = 2.0
+# How fast the latency baseline follows latencies above it
+BASELINE_DRIFT = 0.02
+THROTTLED_BACKOFF = 0.5
+LATENCY_BACKOFF = 0.9
+
+THROTTLED_STATUS_CODES = { 429, 503 }
+# Longest wait accepted from Retry-After
+MAX_RETRY_AFTER = 60.
+
+
+class Throttled(Exception):
+    """Host responded that requests should slow down"""
+
+    def __init__(self, retry_after: Optional[float]):
+        self.retry_after = retry_after
+
+
+def get_retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    Read seconds to wait before retrying from Retry-After header
+
+    :param response: Throttled response
+    :returns: Seconds to wait or None if the header is missing or invalid
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    if value.strip().isdigit():
+        seconds = float(value)
+    else:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.), MAX_RETRY_AFTER)
+
+
+class AdaptiveLimiter:
+    """
+    Limits concurrent requests to a host. The limit is adjusted from how the
+    host responds (additive increase, multiplicative decrease):
+
+    - Grows by roughly one per round trip while all slots are in use and
+      latency stays close to the lowest latency seen
+    - Shrinks a little when latency rises (the host is queueing requests)
+    - Halves on throttling (429, 503) and errors
+
+    Decreases happen at most once per round trip, so a burst of failures
+    from the same window only counts once.
+    """
+
+    def __init__(self, initial: float = INITIAL_LIMIT, minimum: float = MIN_LIMIT, maximum: float = MAX_LIMIT):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self._last_decrease = 0.
+        self._waiters: deque[asyncio.Future] = deque()
+
+
+    async def acquire(self) -> None:
+        """Wait for a free slot"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just before cancellation
+                self.in_flight -= 1
+                self._wake_waiters()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            raise
+
+
+    def release(self, latency: Optional[float], outcome: str = "ok") -> None:
+        """
+        Free slot and adjust limit from the result of the request
+
+        :param latency: Seconds until response headers were received or None
+            if the request failed before that
+        :param outcome: "ok", "throttled" or "error". Anything else (ex.
+            "cancelled") frees the slot without changing the limit
+        """
+        was_saturated = self.in_flight >= int(self.limit)
+        self.in_flight -= 1
+        if outcome in ("throttled", "error"):
+            self._decrease(THROTTLED_BACKOFF)
+        elif outcome == "ok" and latency is not None:
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * BASELINE_DRIFT
+            if latency > self.baseline * LATENCY_TOLERANCE:
+                self._decrease(LATENCY_BACKOFF)
+            elif was_saturated:
+                # About limit requests complete per round trip
+                # Requests above the bulk slots of the scheduler would only
+                # wait there, so the limit does not grow past them
+                maximum = min(self.maximum, scheduler.bulk_slots)
+                self.limit = min(maximum, self.limit + 1 / self.limit)
+        self._wake_waiters()
+
+
+    def _decrease(self, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < (self.baseline or 0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * factor)
+
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+
+# Limiters by host. Kept for the whole run, so limits learned while
+# downloading one book are used for the next
+limiters: dict[str, AdaptiveLimiter] = {}
+
+
+def get_limiter(url: str) -> AdaptiveLimiter:
+    """
+    Get limiter of host in url
+
+    :param url: Url being requested
+    """
+    host = httpx.URL(url).host
+    if host not in limiters:
+        limiters[host] = AdaptiveLimiter()
+    return limiters[host]
@@ -1,24 +1,92 @@
 from grawlix.book import Book, SingleFile, OnlineFile, ImageList, HtmlFiles, Book, OfflineFile, BookData
-from grawlix.exceptions import UnsupportedOutputFormat
+from grawlix.exceptions import UnsupportedOutputFormat, DownloadFailed, ThrottleError
 from grawlix.encryption import decrypt
+from grawlix.network import create_client, response_latency
+from grawlix.scheduler import BULK
+from grawlix.utils.singleflight import SingleFlight
+from grawlix import metrics, tracing
+from .bandwidth import bandwidth
+from .budget import budget, Reservation, UNKNOWN_SIZE_RESERVATION
+from .limiter import AdaptiveLimiter, Throttled, get_limiter, get_retry_after, THROTTLED_STATUS_CODES
+from . import cache
+from .staging import atomic_location
 
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+import asyncio
 import httpx
-from typing import Callable, Optional
+import time
 
 Update = Optional[Callable[[float], None]]
 
+# Attempts at downloading a file when the host is throttling
+MAX_ATTEMPTS = 4
+# Seconds before first retry if the host does not send Retry-After
+RETRY_DELAY = 1.
+
+# Downloads of files in flight by identity. Shared by all output formats
+file_flights: SingleFlight[bytes] = SingleFlight()
+
+
+class SharedDownload:
+    """
+    Download of a file shared by every book waiting for it (ex. a cover
+    shared by books downloaded at the same time). Owns the memory reserved
+    for the content, which is released when the last book is done with it,
+    and reports progress to every book still waiting.
+    """
+
+    def __init__(self) -> None:
+        self.reservation = Reservation(budget)
+        self.holders = 0
+        self.progress = 0.
+        self._updates: list[Callable[[float], None]] = []
+
+
+    def join(self, update: Update) -> None:
+        """Start waiting for download. Progress made so far is reported at once"""
+        self.holders += 1
+        if update:
+            update(self.progress)
+            self._updates.append(update)
+
+
+    def leave(self, update: Update) -> None:
+        """Stop waiting for download or holding its content"""
+        self.holders -= 1
+        if update in self._updates:
+            self._updates.remove(update)
+        if self.holders == 0:
+            self.reservation.release()
+
+
+    def update(self, fraction: float) -> None:
+        self.progress += fraction
+        for update in self._updates:
+            update(fraction)
+
+
+# Shared downloads of files in flight by identity
+shared_downloads: dict[str, SharedDownload] = {}
+
 class OutputFormat:
     # Extension for output files
     extension: str
     input_types: list[type[BookData]]
 
-    def __init__(self) -> None:
-        self._client = httpx.AsyncClient()
+    def __init__(self, client: Optional[httpx.AsyncClient] = None) -> None:
+        """
+        :param client: Shared http client to download with. A new client is
+            created (and closed with the output format) if not given
+        """
+        self._owns_client = client is None
+        self._client = client or create_client(BULK)
 
 
     async def close(self) -> None:
         """Cleanup"""
-        await self._client.aclose()
+        if self._owns_client:
+            await self._client.aclose()
 
 
     async def download(self, book: Book, location: str, update_func: Update) -> None:
@@ -50,26 +118,133 @@ class OutputFormat:
             self._write_offline_file(book.data.file, location)
 
 
-    async def _download_file(self, file: OnlineFile, update: Update = None) -> bytes:
+    @asynccontextmanager
+    async def _download_file(self, file: OnlineFile, update: Update = None) -> AsyncIterator[bytes]:
         """
         Download `grawlix.OnlineFile` 
+        Uses the file cache if it is enabled
+
+        The size of the file is held in the memory budget until the block
+        exits, so the content should be written or dropped inside it.
+
+        :param file: File to download
+        :param update: Update function that is called with a percentage every time a chunk is downloaded
+        :returns: Content of downloaded file
+        """
+        if cache.file_cache is not None:
+            content = await asyncio.to_thread(cache.file_cache.get, file)
+            if content is not None:
+                async with budget.reservation() as reservation:
+                    await reservation.resize(len(content))
+                    if update:
+                        update(1)
+                    yield content
+                return
+        identity = cache.FileCache.file_identity(file)
+        # Files already being downloaded wait for that download instead. The
+        # download does not belong to the book that started it, so that book
+        # can be cancelled while others still wait
+        download = shared_downloads.get(identity)
+        if download is None or identity not in file_flights:
+            # Content of a finished download can still be held by books
+            # writing it, which release its memory themselves
+            download = shared_downloads[identity] = SharedDownload()
+        download.join(update)
+        try:
+            content = await file_flights.do(identity, lambda: self._fetch_and_cache_file(file, download.reservation, download.update))
+            yield content
+        finally:
+            download.leave(update)
+            if download.holders == 0 and shared_downloads.get(identity) is download:
+                del shared_downloads[identity]
+
+
+    async def _fetch_and_cache_file(self, file: OnlineFile, reservation: Reservation, update: Update = None) -> bytes:
+        content = await self._fetch_file(file, reservation, update)
+        if cache.file_cache is not None:
+            await asyncio.to_thread(cache.file_cache.put, file, content)
+        return content
+
+
+    async def _fetch_file(self, file: OnlineFile, reservation: Reservation, update: Update = None) -> bytes:
+        """
+        Download and decrypt `grawlix.OnlineFile` from its url
 
         :param file: File to download
+        :param reservation: Memory reserved for the content
         :param update: Update function that is called with a percentage every time a chunk is downloaded
         :returns: Content of downloaded file
         """
-        content = b""
-        async with self._client.stream("GET", file.url, headers = file.headers, cookies = file.cookies, follow_redirects=True) as request:
-            total_filesize = int(request.headers["Content-length"])
-            async for chunk in request.aiter_bytes():
-                content += chunk
-                if update:
-                    update(len(chunk)/total_filesize)
-            if file.encryption is not None:
+        limiter = get_limiter(file.url)
+        # Reserved before the request is sent, so new downloads wait instead
+        # of growing memory usage past the budget. Corrected to the real size
+        # when the response arrives
+        with tracing.span("queued", "memory"):
+            await reservation.resize(UNKNOWN_SIZE_RESERVATION)
+        for attempt in range(MAX_ATTEMPTS):
+            with tracing.span("queued", "network"):
+                await limiter.acquire()
+            try:
+                content = await self._fetch_content(file, limiter, reservation, update)
+                break
+            except Throttled as throttled:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise ThrottleError
+                metrics.observe_retry(httpx.URL(file.url).host)
+                delay = throttled.retry_after
+                if delay is None:
+                    delay = RETRY_DELAY * 2**attempt
+                await asyncio.sleep(delay)
+        if file.encryption is not None:
+            with metrics.phase("decrypt"):
                 content = decrypt(content, file.encryption)
         return content
 
 
+    async def _fetch_content(self, file: OnlineFile, limiter: AdaptiveLimiter, reservation: Reservation, update: Update = None) -> bytes:
+        """
+        Download content of file while holding a slot of the limiter of its
+        host. The slot is released with the outcome of the request.
+
+        :raises Throttled: If the host asks to slow down
+        """
+        latency: Optional[float] = None
+        outcome = "error"
+        try:
+            with metrics.phase("download"):
+                start = time.perf_counter()
+                async with self._client.stream("GET", file.url, headers = file.headers, cookies = file.cookies, follow_redirects=True) as response:
+                    # Time waiting for a slot of the request scheduler is
+                    # left out, since it says nothing about the host
+                    latency = response_latency(response)
+                    if response.status_code in THROTTLED_STATUS_CODES:
+                        outcome = "throttled"
+                        raise Throttled(get_retry_after(response))
+                    if response.is_error:
+                        # Only server errors say something about the load
+                        # of the host
+                        outcome = "error" if response.is_server_error else "ok"
+                        raise DownloadFailed
+                    total_filesize = get_content_length(response)
+                    if total_filesize is not None:
+                        await reservation.resize(total_filesize)
+                    chunks: list[bytes] = []
+                    async for chunk in response.aiter_bytes():
+                        await bandwidth.consume(len(chunk))
+                        chunks.append(chunk)
+                        if update and total_filesize:
+                            update(len(chunk)/total_filesize)
+                    content = b"".join(chunks)
+                    metrics.observe_transfer(response.url.host, len(content), time.perf_counter() - start)
+                    outcome = "ok"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            limiter.release(latency, outcome)
+        return content
+
+
     async def _download_and_write_file(self, file: OnlineFile, location: str, update: Update = None) -> None:
         """
         Download `grawlix.OnlineFile` and write to content to disk
@@ -78,9 +253,10 @@ class OutputFormat:
         :param location: Path to where the file is written
         :param update: Update function that is called with a percentage every time a chunk is downloaded
         """
-        content = await self._download_file(file, update)
-        with open(location, "wb") as f:
-            f.write(content)
+        async with self._download_file(file, update) as content:
+            with metrics.phase("write"), atomic_location(location) as temporary:
+                with open(temporary, "wb") as f:
+                    f.write(content)
 
 
     def _write_offline_file(self, file: OfflineFile, location: str) -> None:
@@ -90,8 +266,23 @@ class OutputFormat:
         :param file: File to write to disk
         :param location: Path to where the file is written
         """
-        with open(location, "wb") as f:
-            content = file.content
-            if file.encryption:
+        content = file.content
+        if file.encryption:
+            with metrics.phase("decrypt"):
                 content = decrypt(content, file.encryption)
-            f.write(content)
+        with metrics.phase("write"), atomic_location(location) as temporary:
+            with open(temporary, "wb") as f:
+                f.write(content)
+
+
+def get_content_length(response: httpx.Response) -> Optional[int]:
+    """
+    Read size of response body from headers
+
+    :param response: Response to read header from
+    :returns: Size of body or None if the server did not send it
+    """
+    content_length = response.headers.get("Content-Length")
+    if content_length is None or not content_length.isdigit():
+        return None
+    return int(content_length)
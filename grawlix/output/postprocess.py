@@ -0,0 +1,143 @@
+from grawlix import logging, metrics, tracing
+
+from dataclasses import dataclass
+from typing import Optional
+from rich.markup import escape
+import asyncio
+import os
+import shutil
+import time
+
+# Commands run on output files by extension if the config file does not
+# configure any for the extension. Skipped if the program is not installed.
+# https://web.archive.org/web/20221016154220/https://github.com/BentonEdmondson/knock
+DEFAULT_HOOKS: dict[str, list[list[str]]] = {
+    "acsm": [["knock", "{location}"]],
+}
+
+
+@dataclass(slots=True)
+class HookResult:
+    """Outcome of running a command on an output file"""
+    command: list[str]
+    location: str
+    returncode: Optional[int]
+    seconds: float
+    stderr: bytes = b""
+
+
+class PostProcessor:
+    """
+    Runs external programs on finished output files. Programs run in the
+    background, limited to `workers` at the same time, so following downloads
+    continue while they run.
+    """
+
+    def __init__(self, hooks: Optional[dict[str, list[list[str]]]] = None, workers: int = 2):
+        """
+        :param hooks: Commands to run by output extension. Commands can contain
+            `{location}`, `{directory}` and `{stem}` (location without extension)
+        :param workers: Maximum number of programs running at the same time
+        """
+        self.hooks = hooks or {}
+        self.workers = workers
+        self.results: list[HookResult] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: set[asyncio.Task] = set()
+
+
+    def commands(self, extension: str) -> list[list[str]]:
+        """Commands to run on files with extension"""
+        if extension in self.hooks:
+            return self.hooks[extension]
+        return [
+            command for command in DEFAULT_HOOKS.get(extension, [])
+            if shutil.which(command[0]) is not None
+        ]
+
+
+    def submit(self, location: str, extension: str) -> None:
+        """
+        Run configured commands on output file in the background
+
+        :param location: Path of output file
+        :param extension: Extension of output format
+        """
+        commands = self.commands(extension)
+        if not commands:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        task = asyncio.create_task(self._run_commands(commands, location))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+    async def wait(self) -> None:
+        """Wait for all running and queued commands to finish"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+    async def _run_commands(self, commands: list[list[str]], location: str) -> None:
+        # Commands for the same file run in order, since later commands can
+        # depend on the output of earlier ones
+        for command in commands:
+            result = await self._run_command(command, location)
+            self.results.append(result)
+            report(result)
+            if result.returncode != 0:
+                break
+
+
+    async def _run_command(self, command: list[str], location: str) -> HookResult:
+        stem, _ = os.path.splitext(location)
+        arguments = [
+            argument.format(
+                location = location,
+                directory = os.path.dirname(location) or ".",
+                stem = stem,
+            )
+            for argument in command
+        ]
+        assert self._semaphore is not None
+        async with self._semaphore:
+            start = time.perf_counter()
+            with metrics.phase("postprocess"), tracing.span(command[0], "postprocess", location = location):
+                try:
+                    process = await asyncio.create_subprocess_exec(
+                        *arguments,
+                        stdout = asyncio.subprocess.DEVNULL,
+                        stderr = asyncio.subprocess.PIPE,
+                    )
+                    _, stderr = await process.communicate()
+                    returncode: Optional[int] = process.returncode
+                except OSError as error:
+                    # Program not found or not executable
+                    stderr = str(error).encode()
+                    returncode = None
+            return HookResult(
+                command = arguments,
+                location = location,
+                returncode = returncode,
+                seconds = time.perf_counter() - start,
+                stderr = stderr,
+            )
+
+
+def report(result: HookResult) -> None:
+    """Print outcome of command"""
+    # Paths and command output can contain text that looks like markup
+    name = escape(os.path.basename(result.command[0]))
+    filename = escape(os.path.basename(result.location))
+    if result.returncode == 0:
+        logging.info(f"[magenta]{name}[/] finished [blue]{filename}[/] in {result.seconds:.1f}s")
+    else:
+        status = "could not be started" if result.returncode is None else f"exited with status {result.returncode}"
+        logging.error(f"[red]{name} {status}[/] for [blue]{filename}[/] after {result.seconds:.1f}s")
+        if result.stderr:
+            logging.debug(escape(result.stderr.decode("utf8", errors = "replace").strip()), remove_styling = True)
+
+
+# Post processor used by `download_book`
+post_processor = PostProcessor()
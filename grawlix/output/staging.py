@@ -0,0 +1,118 @@
+from contextlib import contextmanager
+from typing import Iterator
+import os
+import shutil
+import tempfile
+
+JOURNAL_NAME = "journal"
+
+
+def _default_file_mode() -> int:
+    """Mode of new files under the umask of the process"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+# Read once, since the umask can only be read by changing it
+FILE_MODE = _default_file_mode()
+
+
+@contextmanager
+def atomic_location(location: str) -> Iterator[str]:
+    """
+    Write output to a temporary path that is renamed to `location` when the
+    block completes, so `location` never contains a partially written file.
+
+    :param location: Final path of output
+    :returns: Temporary path to write to
+    """
+    directory, filename = os.path.split(location)
+    fd, temporary = tempfile.mkstemp(dir = directory or ".", prefix = f".{filename}.", suffix = ".part")
+    # mkstemp creates files readable only by the owner. Outputs get the same
+    # permissions as any other new file
+    try:
+        os.fchmod(fd, FILE_MODE)
+    finally:
+        os.close(fd)
+    try:
+        yield temporary
+        os.replace(temporary, location)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def write_file_atomic(location: str, content: bytes) -> None:
+    """
+    Write file so readers never see partially written content
+
+    :param location: Path of file
+    :param content: Content of file
+    """
+    with atomic_location(location) as temporary:
+        with open(temporary, "wb") as f:
+            f.write(content)
+
+
+class Staging:
+    """
+    Directory next to an output file storing the pieces it is assembled from.
+    A journal records every completed piece, so an interrupted download can
+    continue with the pieces already on disk.
+    """
+
+    def __init__(self, location: str):
+        """
+        :param location: Path of output file being assembled
+        """
+        self.directory = f"{location}.grawlix-parts"
+        self._journal_path = os.path.join(self.directory, JOURNAL_NAME)
+        self._completed: set[str] = set()
+        os.makedirs(self.directory, exist_ok = True)
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path, "r") as f:
+                self._completed = { line.strip() for line in f if line.strip() }
+
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._completed
+
+
+    def __len__(self) -> int:
+        return len(self._completed)
+
+
+    def path(self, name: str) -> str:
+        """Path of piece inside staging directory"""
+        return os.path.join(self.directory, name)
+
+
+    def write(self, name: str, content: bytes) -> None:
+        """
+        Store piece and mark it as completed
+
+        :param name: Name of piece (used as filename)
+        :param content: Content of piece
+        """
+        write_file_atomic(self.path(name), content)
+        self._mark_completed(name)
+
+
+    def _mark_completed(self, name: str) -> None:
+        # Journal is only appended to after the piece is fully written, so
+        # every entry in it points to a complete file
+        with open(self._journal_path, "a") as f:
+            f.write(f"{name}\n")
+        self._completed.add(name)
+
+
+    def read(self, name: str) -> bytes:
+        """Read completed piece"""
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+
+    def remove(self) -> None:
+        """Remove staging directory and all pieces in it"""
+        shutil.rmtree(self.directory, ignore_errors = True)
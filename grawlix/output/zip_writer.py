@@ -0,0 +1,295 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+import asyncio
+import mimetypes
+import os
+import posixpath
+import struct
+import time
+import zlib
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+DEFAULT_LEVEL = 6
+# Compression level by media type. Level 0 stores files without compression,
+# which is used for formats that are already compressed
+compression_levels: dict[str, int] = {
+    "image/jpeg": 0,
+    "image/png": 0,
+    "image/webp": 0,
+    "image/gif": 0,
+    "font/woff": 0,
+    "font/woff2": 0,
+    "audio/mpeg": 0,
+    "application/epub+zip": 0,
+}
+
+MEDIA_TYPES = {
+    ".html": "application/xhtml+xml",
+    ".xhtml": "application/xhtml+xml",
+    ".htm": "application/xhtml+xml",
+    ".css": "text/css",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".svg": "image/svg+xml",
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".ncx": "application/x-dtbncx+xml",
+    ".js": "application/javascript",
+    ".smil": "application/smil+xml",
+    ".mp3": "audio/mpeg",
+    ".xml": "application/xml",
+}
+
+# Shared by all writers. zlib releases the GIL while compressing, so
+# entries are compressed in parallel
+_executor: Optional[ThreadPoolExecutor] = None
+
+ZIP64_LIMIT = 0xFFFFFFFF
+
+
+def media_type(name: str) -> str:
+    """Media type of file from its extension"""
+    extension = posixpath.splitext(name)[1].lower()
+    if extension in MEDIA_TYPES:
+        return MEDIA_TYPES[extension]
+    guessed, _ = mimetypes.guess_type(name)
+    return guessed or "application/octet-stream"
+
+
+def compression_level(name: str) -> int:
+    """Compression level of file from its media type"""
+    return compression_levels.get(media_type(name), DEFAULT_LEVEL)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers = os.cpu_count() or 1, thread_name_prefix = "zip")
+    return _executor
+
+
+@dataclass(slots=True)
+class CompressedEntry:
+    method: int
+    data: bytes
+    crc: int
+    size: int
+
+
+@dataclass(slots=True)
+class WrittenEntry:
+    name: bytes
+    method: int
+    crc: int
+    compressed_size: int
+    size: int
+    offset: int
+    dos_time: int
+    dos_date: int
+
+
+def compress(content: bytes, level: int) -> CompressedEntry:
+    """
+    Compress content of entry. Content is stored if compression does not
+    make it smaller.
+    """
+    crc = zlib.crc32(content)
+    if level > 0:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        data = compressor.compress(content) + compressor.flush()
+        if len(data) < len(content):
+            return CompressedEntry(ZIP_DEFLATED, data, crc, len(content))
+    return CompressedEntry(ZIP_STORED, content, crc, len(content))
+
+
+class ZipWriter:
+    """
+    Writes zip files with entries compressed in parallel on a thread pool.
+    Entries are written to the file in the order they are added.
+    """
+
+    def __init__(self, location: str, max_pending: Optional[int] = None):
+        """
+        :param location: Path of zip file
+        :param max_pending: Maximum number of entries compressed at the same
+            time before `write` waits for the oldest one
+        """
+        self._file: BinaryIO = open(location, "wb")
+        self._entries: list[WrittenEntry] = []
+        self._pending: deque[tuple[bytes, tuple[int, int], Future[CompressedEntry]]] = deque()
+        self._max_pending = max_pending or 2 * (os.cpu_count() or 1)
+
+
+    async def __aenter__(self) -> "ZipWriter":
+        return self
+
+
+    async def __aexit__(self, exception_type, *_) -> None:
+        if exception_type is None:
+            await self.close()
+        else:
+            self.abort()
+
+
+    def abort(self) -> None:
+        """Close file without finishing it"""
+        for _, _, future in self._pending:
+            future.cancel()
+        self._file.close()
+
+
+    async def write(self, name: str, content: bytes, level: Optional[int] = None) -> None:
+        """
+        Add entry to zip file
+
+        :param name: Path of entry in zip file
+        :param content: Content of entry
+        :param level: Compression level (0-9). Depends on media type of name
+            if not given
+        """
+        if level is None:
+            level = compression_level(name)
+        dos_time = dos_date_time(time.localtime())
+        # Small and uncompressed entries are not worth sending to a thread
+        if level == 0 or len(content) < 1024:
+            future: Future[CompressedEntry] = Future()
+            future.set_result(compress(content, level))
+        else:
+            future = get_executor().submit(compress, content, level)
+        self._pending.append((name.encode("utf8"), dos_time, future))
+        self._write_completed()
+        while len(self._pending) > self._max_pending:
+            await self._wait_oldest()
+
+
+    async def _wait_oldest(self) -> None:
+        """Wait for compression of the oldest pending entry and write it"""
+        # Awaited instead of blocking, so other downloads keep running
+        await asyncio.wrap_future(self._pending[0][2])
+        self._write_completed()
+
+
+    def _write_completed(self) -> None:
+        """Write compressed entries at the front of the queue"""
+        while self._pending and self._pending[0][2].done():
+            name, dos_time, future = self._pending.popleft()
+            self._write_entry(name, dos_time, future.result())
+
+
+    def _write_entry(self, name: bytes, dos_time: tuple[int, int], entry: CompressedEntry) -> None:
+        offset = self._file.tell()
+        compressed_size = len(entry.data)
+        extra = b""
+        header_compressed_size, header_size = compressed_size, entry.size
+        if compressed_size >= ZIP64_LIMIT or entry.size >= ZIP64_LIMIT:
+            extra = struct.pack("<HHQQ", 0x0001, 16, entry.size, compressed_size)
+            header_compressed_size = header_size = ZIP64_LIMIT
+        self._file.write(struct.pack(
+            "<IHHHHHIIIHH",
+            0x04034b50,
+            45 if extra else 20,
+            0x800, # Utf-8 filenames
+            entry.method,
+            dos_time[0],
+            dos_time[1],
+            entry.crc,
+            header_compressed_size,
+            header_size,
+            len(name),
+            len(extra),
+        ))
+        self._file.write(name)
+        self._file.write(extra)
+        self._file.write(entry.data)
+        self._entries.append(WrittenEntry(
+            name = name,
+            method = entry.method,
+            crc = entry.crc,
+            compressed_size = compressed_size,
+            size = entry.size,
+            offset = offset,
+            dos_time = dos_time[0],
+            dos_date = dos_time[1],
+        ))
+
+
+    async def close(self) -> None:
+        """Write remaining entries and central directory and close file"""
+        while self._pending:
+            await self._wait_oldest()
+        directory_offset = self._file.tell()
+        for entry in self._entries:
+            self._write_directory_entry(entry)
+        directory_size = self._file.tell() - directory_offset
+        count = len(self._entries)
+        if count >= 0xFFFF or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+            zip64_offset = self._file.tell()
+            self._file.write(struct.pack(
+                "<IQHHIIQQQQ",
+                0x06064b50, 44, 45, 45, 0, 0,
+                count, count, directory_size, directory_offset
+            ))
+            self._file.write(struct.pack("<IIQI", 0x07064b50, 0, zip64_offset, 1))
+            count = min(count, 0xFFFF)
+            directory_size = min(directory_size, ZIP64_LIMIT)
+            directory_offset = min(directory_offset, ZIP64_LIMIT)
+        self._file.write(struct.pack(
+            "<IHHHHIIH",
+            0x06054b50, 0, 0, count, count, directory_size, directory_offset, 0
+        ))
+        self._file.close()
+
+
+    def _write_directory_entry(self, entry: WrittenEntry) -> None:
+        zip64 = []
+        size, compressed_size, offset = entry.size, entry.compressed_size, entry.offset
+        if entry.size >= ZIP64_LIMIT:
+            zip64.append(entry.size)
+            size = ZIP64_LIMIT
+        if entry.compressed_size >= ZIP64_LIMIT:
+            zip64.append(entry.compressed_size)
+            compressed_size = ZIP64_LIMIT
+        if entry.offset >= ZIP64_LIMIT:
+            zip64.append(entry.offset)
+            offset = ZIP64_LIMIT
+        extra = struct.pack(f"<HH{len(zip64)}Q", 0x0001, 8 * len(zip64), *zip64) if zip64 else b""
+        version = 45 if zip64 else 20
+        self._file.write(struct.pack(
+            "<IHHHHHHIIIHHHHHII",
+            0x02014b50,
+            3 << 8 | version, # Made by unix
+            version,
+            0x800,
+            entry.method,
+            entry.dos_time,
+            entry.dos_date,
+            entry.crc,
+            compressed_size,
+            size,
+            len(entry.name),
+            len(extra),
+            0, # Comment length
+            0, # Disk number
+            0, # Internal attributes
+            0o644 << 16, # External attributes (unix permissions)
+            offset,
+        ))
+        self._file.write(entry.name)
+        self._file.write(extra)
+
+
+def dos_date_time(local_time: time.struct_time) -> tuple[int, int]:
+    """Time and date in the MS-DOS format used by zip files"""
+    year = max(local_time.tm_year, 1980)
+    dos_time = local_time.tm_hour << 11 | local_time.tm_min << 5 | local_time.tm_sec // 2
+    dos_date = (year - 1980) << 9 | local_time.tm_mon << 5 | local_time.tm_mday
+    return dos_time, dos_date
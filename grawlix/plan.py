@@ -0,0 +1,354 @@
+"""
+Dry run of a download
+
+Resolves urls and series into books with the metadata requests of their
+sources and probes the files of every book for their size, without
+downloading them or writing anything. Sizes are read from HEAD requests, or
+from the first byte of the file for servers that do not answer HEAD.
+"""
+from grawlix.archive import Archive, url_key, book_key
+from grawlix.book import Book, Series, OnlineFile, OfflineFile, SingleFile, ImageList, HtmlFiles, EpubInParts
+from grawlix.config import Config
+from grawlix.exceptions import GrawlixError, AccessDenied
+from grawlix.network import create_client, response_latency
+from grawlix.output import get_output_format, format_output_location
+from grawlix.output.bandwidth import bandwidth
+from grawlix.output.directory_index import directory_index
+from grawlix.output.limiter import get_limiter, INITIAL_LIMIT
+from grawlix.output.output_format import get_content_length
+from grawlix.scheduler import BULK
+from grawlix.sources import load_source, Source
+from grawlix import logging, metrics
+
+from dataclasses import dataclass, field
+from typing import Optional
+from rich.table import Table
+import asyncio
+import httpx
+import re
+import statistics
+import time
+
+# Books of a series resolved at the same time
+MAX_CONCURRENT_BOOKS = 8
+# Files sampled to measure download speed and bytes read from each
+SPEED_SAMPLES = 3
+SPEED_SAMPLE_SIZE = 1024 * 1024
+
+CONTENT_RANGE = re.compile(r"bytes \d+-\d+/(\d+)")
+
+
+@dataclass(slots=True)
+class Probe:
+    """Result of probing a file"""
+    size: Optional[int]
+    latency: float
+
+
+@dataclass(slots=True)
+class PlannedBook:
+    """Book that would be downloaded"""
+    source: str
+    series: Optional[str]
+    title: str
+    files: list[OnlineFile] = field(default_factory=list)
+    # Size of each file or None if unknown
+    file_sizes: list[Optional[int]] = field(default_factory=list)
+    # Bytes of files that are already known (ex. offline files)
+    known_size: int = 0
+    size: int = 0
+    unknown_sizes: int = 0
+    existing: bool = False
+
+
+@dataclass(slots=True)
+class Totals:
+    books: int = 0
+    files: int = 0
+    size: int = 0
+    unknown_sizes: int = 0
+
+    def add(self, book: PlannedBook) -> None:
+        self.books += 1
+        self.files += len(book.files)
+        self.size += book.size
+        self.unknown_sizes += book.unknown_sizes
+
+
+def book_files(book: Book) -> tuple[list[OnlineFile], int]:
+    """
+    Files that would be downloaded for book
+
+    :returns: Online files and size of offline files
+    """
+    data = book.data
+    if isinstance(data, SingleFile):
+        if isinstance(data.file, OfflineFile):
+            return [], len(data.file.content)
+        return [data.file], 0
+    if isinstance(data, ImageList):
+        return list(data.images), 0
+    if isinstance(data, EpubInParts):
+        return list(data.files), 0
+    if isinstance(data, HtmlFiles):
+        files = [html.file for html in data.htmlfiles]
+        if data.cover:
+            files.append(data.cover)
+        return files, 0
+    return [], 0
+
+
+class Planner:
+    """Collects books from urls and probes their files"""
+
+    def __init__(self, config: Config, args, archive: Optional[Archive] = None):
+        self.config = config
+        self.args = args
+        self.archive = archive
+        self.books: list[PlannedBook] = []
+        self.probes: list[Probe] = []
+        self._client = create_client(BULK)
+
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+    async def add_url(self, url: str) -> None:
+        """
+        Add books in url to plan
+
+        :param url: Url of book or series
+        """
+        # Imported here to avoid a circular import
+        from grawlix.__main__ import authenticate
+        if self.archive is not None and url_key(url) in self.archive:
+            return
+        source: Source = load_source(url)
+        if not source.authenticated and source.requires_authentication:
+            with metrics.phase("authenticate"):
+                await authenticate(url, source, self.config, self.args)
+        with metrics.phase("metadata"):
+            result = await source.download(url)
+        if isinstance(result, Book):
+            await self._add_book(source, result, self.args.output or "{title}.{ext}")
+        elif isinstance(result, Series):
+            await self._add_series(source, result)
+
+
+    async def _add_series(self, source: Source, series: Series) -> None:
+        template = self.args.output or "{series}/{title}.{ext}"
+        book_ids = series.book_ids
+        if self.archive is not None:
+            book_ids = [book_id for book_id in book_ids if book_key(source, book_id) not in self.archive]
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_BOOKS)
+
+        async def add_book(book_id) -> None:
+            async with semaphore:
+                try:
+                    with metrics.phase("metadata"):
+                        book = await source.download_book_from_id(book_id)
+                except AccessDenied:
+                    logging.info(f"Skipping {book_id} in {series.title} - Access Denied")
+                    return
+            await self._add_book(source, book, template, series.title)
+
+        await asyncio.gather(*[add_book(book_id) for book_id in book_ids])
+
+
+    async def _add_book(self, source: Source, book: Book, template: str, series: Optional[str] = None) -> None:
+        files, known_size = book_files(book)
+        planned = PlannedBook(
+            source = source.name,
+            series = series or book.metadata.series,
+            title = book.metadata.title,
+            files = files,
+            known_size = known_size,
+        )
+        self.books.append(planned)
+        try:
+            output_format = get_output_format(book, template, self._client)
+            location = format_output_location(book, output_format, template)
+            planned.existing = not book.overwrite and directory_index.exists(location)
+        except GrawlixError:
+            pass
+        if planned.existing:
+            return
+        sizes = await asyncio.gather(*[self._probe(file) for file in files])
+        planned.file_sizes = list(sizes)
+        planned.size = known_size + sum(size for size in sizes if size is not None)
+        planned.unknown_sizes = sum(1 for size in sizes if size is None)
+
+
+    async def _probe(self, file: OnlineFile) -> Optional[int]:
+        """
+        Find size of file without downloading it. Uses the same per host
+        limits as downloads.
+
+        :returns: Size of file or None if the server does not tell
+        """
+        limiter = get_limiter(file.url)
+        await limiter.acquire()
+        latency: Optional[float] = None
+        outcome = "error"
+        try:
+            response = await self._client.head(file.url, headers = file.headers, cookies = file.cookies, follow_redirects = True)
+            # Measured from when the request scheduler let the request
+            # through, so queueing behind other probes is left out
+            latency = response_latency(response)
+            size = get_content_length(response) if response.is_success else None
+            if size is None:
+                # Signed urls and some servers only answer GET
+                size = await self._probe_range(file)
+            outcome = "ok"
+            if latency is not None:
+                self.probes.append(Probe(size, latency))
+            return size
+        except httpx.HTTPError:
+            return None
+        finally:
+            limiter.release(latency, outcome)
+
+
+    async def _probe_range(self, file: OnlineFile) -> Optional[int]:
+        headers = { **(file.headers or {}), "Range": "bytes=0-0" }
+        async with self._client.stream("GET", file.url, headers = headers, cookies = file.cookies, follow_redirects = True) as response:
+            if response.status_code == 206:
+                match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+                return int(match.group(1)) if match else None
+            if response.is_success:
+                # Range is not supported. The body is never read
+                return get_content_length(response)
+            return None
+
+
+    async def measure_speed(self) -> Optional[float]:
+        """
+        Measure download speed of a single connection by reading the start of
+        the largest files
+
+        :returns: Bytes per second or None if nothing could be measured
+        """
+        sized_files = [
+            (size, file)
+            for book in self.books if not book.existing
+            for file, size in zip(book.files, book.file_sizes)
+            if size is not None
+        ]
+        sized_files.sort(key = lambda item: item[0], reverse = True)
+        candidates = [file for _, file in sized_files[:SPEED_SAMPLES]]
+        speeds = []
+        for file in candidates:
+            headers = { **(file.headers or {}), "Range": f"bytes=0-{SPEED_SAMPLE_SIZE - 1}" }
+            try:
+                async with self._client.stream("GET", file.url, headers = headers, cookies = file.cookies, follow_redirects = True) as response:
+                    if not response.is_success:
+                        continue
+                    start = time.perf_counter()
+                    received = 0
+                    async for chunk in response.aiter_bytes():
+                        received += len(chunk)
+                        if received >= SPEED_SAMPLE_SIZE:
+                            break
+                    seconds = time.perf_counter() - start
+            except httpx.HTTPError:
+                continue
+            if seconds > 0 and received > 0:
+                speeds.append(received / seconds)
+        if not speeds:
+            return None
+        return statistics.median(speeds)
+
+
+def estimate_seconds(books: list[PlannedBook], probes: list[Probe], speed: Optional[float]) -> Optional[float]:
+    """
+    Rough estimate of download time. Requests are assumed to run as many at
+    a time as the initial limit of each host, and transfers to be limited by
+    the measured speed and the bandwidth limit.
+    """
+    pending = [book for book in books if not book.existing]
+    requests = sum(len(book.files) for book in pending)
+    size = sum(book.size for book in pending)
+    latency = statistics.median(probe.latency for probe in probes) if probes else 0.
+    rates = []
+    if speed is not None:
+        rates.append(speed * INITIAL_LIMIT)
+    if bandwidth.rate:
+        rates.append(bandwidth.rate)
+    if not rates:
+        return None
+    return size / min(rates) + requests * latency / INITIAL_LIMIT
+
+
+def format_size(size: int) -> str:
+    if size < 1024:
+        return f"{size} B"
+    value = size / 1024
+    for unit in ("KiB", "MiB", "GiB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TiB"
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
+
+
+def print_plan(books: list[PlannedBook], estimate: Optional[float]) -> None:
+    """Print totals per source and series"""
+    groups: dict[tuple[str, str], Totals] = {}
+    existing = 0
+    total = Totals()
+    for book in books:
+        if book.existing:
+            existing += 1
+            continue
+        groups.setdefault((book.source, book.series or ""), Totals()).add(book)
+        total.add(book)
+    table = Table("Source", "Series", "Books", "Files", "Size", box = None)
+    for (source, series), totals in sorted(groups.items()):
+        size = format_size(totals.size)
+        if totals.unknown_sizes:
+            size += f" (+{totals.unknown_sizes} unknown)"
+        table.add_row(f"[magenta]{source}[/]", f"[blue]{series}[/]", str(totals.books), str(totals.files), size)
+    logging.console.print(table)
+    logging.info("")
+    logging.info(f"[yellow not bold]{total.books}[/] books with [yellow not bold]{total.files}[/] files, {format_size(total.size)} in total")
+    if total.unknown_sizes:
+        logging.info(f"Size of [yellow not bold]{total.unknown_sizes}[/] files is unknown")
+    if existing:
+        logging.info(f"Skipping [yellow not bold]{existing}[/] books - Files already exist")
+    if estimate is not None:
+        logging.info(f"Estimated download time: [yellow not bold]{format_duration(estimate)}[/]")
+
+
+async def run(urls: list[str], config: Config, args, archive: Optional[Archive] = None) -> None:
+    """
+    Plan download of urls and print the result
+
+    :param urls: Urls to plan
+    :param config: Content of config file
+    :param args: Command line options
+    :param archive: Archive of completed books
+    """
+    planner = Planner(config, args, archive)
+    try:
+        for url in urls:
+            if not url:
+                continue
+            try:
+                await planner.add_url(url)
+            except GrawlixError as error:
+                error.print_error()
+        speed = await planner.measure_speed()
+        estimate = estimate_seconds(planner.books, planner.probes, speed)
+    finally:
+        await planner.close()
+    print_plan(planner.books, estimate)
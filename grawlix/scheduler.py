@@ -0,0 +1,109 @@
+"""
+Process wide scheduling of http requests.
+
+Requests are either control traffic (logins, metadata and page lists, sent by
+sources) or bulk traffic (the content of books, sent by output formats).
+Control requests are small but the rest of the pipeline waits for them, so
+they are never queued behind bulk transfers: a number of slots are reserved
+for them, and they are first in line when any slot is freed.
+"""
+from collections import deque
+from typing import Optional
+import asyncio
+
+CONTROL = "control"
+BULK = "bulk"
+
+DEFAULT_SLOTS = 32
+
+
+class RequestScheduler:
+    """Limits the number of concurrent requests with priority for control traffic"""
+
+    def __init__(self, slots: int = DEFAULT_SLOTS, reserved: Optional[int] = None):
+        """
+        :param slots: Maximum number of requests in flight
+        :param reserved: Slots only control requests can use. Defaults to an
+            eighth of the slots
+        """
+        self._waiters: dict[str, deque[asyncio.Future]] = {
+            CONTROL: deque(),
+            BULK: deque(),
+        }
+        self._in_flight = { CONTROL: 0, BULK: 0 }
+        self.configure(slots, reserved)
+
+
+    def configure(self, slots: int, reserved: Optional[int] = None) -> None:
+        """Change number of slots"""
+        self.slots = slots
+        self.reserved = reserved if reserved is not None else max(1, slots // 8)
+
+
+    @property
+    def bulk_slots(self) -> int:
+        """Maximum number of bulk requests in flight"""
+        return self.slots - self.reserved
+
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight[CONTROL] + self._in_flight[BULK]
+
+
+    def _can_start(self, priority: str) -> bool:
+        if self.in_flight >= self.slots:
+            return False
+        if priority == BULK:
+            return self._in_flight[BULK] < self.bulk_slots
+        return True
+
+
+    async def acquire(self, priority: str) -> None:
+        """
+        Wait for a free slot
+
+        :param priority: `CONTROL` or `BULK`
+        """
+        # Bulk requests also wait for queued control requests
+        queued = self._waiters[CONTROL] or (priority == BULK and self._waiters[BULK])
+        if not queued and self._can_start(priority):
+            self._in_flight[priority] += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(priority)
+            elif future in self._waiters[priority]:
+                self._waiters[priority].remove(future)
+            raise
+
+
+    def release(self, priority: str) -> None:
+        """
+        Free slot acquired with `acquire`
+
+        :param priority: Priority the slot was acquired with
+        """
+        self._in_flight[priority] -= 1
+        self._wake_waiters()
+
+
+    def _wake_waiters(self) -> None:
+        for priority in (CONTROL, BULK):
+            waiters = self._waiters[priority]
+            while waiters and self._can_start(priority):
+                future = waiters.popleft()
+                if not future.done():
+                    self._in_flight[priority] += 1
+                    future.set_result(None)
+            if waiters:
+                # Bulk requests do not overtake waiting control requests
+                return
+
+
+# Shared by all http clients in the process
+scheduler = RequestScheduler()
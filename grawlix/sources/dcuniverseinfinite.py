@@ -1,14 +1,18 @@
-from grawlix import logging
+from grawlix import logging, metrics
 from grawlix.book import Result, Book, Metadata, OnlineFile, ImageList, Series
 from grawlix.encryption import Encryption
 from grawlix.exceptions import InvalidUrl, AccessDenied
 from .source import Source
 
+import asyncio
+import httpx
 import re
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 from hashlib import sha256
 from Crypto.Cipher import AES
 
+AUTH_ERROR_STATUS_CODES = { 401, 403 }
+
 class DcUniverseInfinite(Source):
     name = "DC Universe Infinite"
     match: list[str] = [
@@ -21,16 +25,57 @@ class DcUniverseInfinite(Source):
     ]
     _authentication_methods = [ "cookies" ]
 
+    def __init__(self):
+        super().__init__()
+        self.plan: Optional[str] = None
+        # Incremented every time the session is set up, so concurrent
+        # requests failing with the same session only refresh it once
+        self._session = 0
+        self._session_lock = asyncio.Lock()
+
+
+    async def _setup_session(self, failed_session: Optional[int] = None) -> None:
+        """
+        Set authentication headers and download subscription plan. Only
+        done once per session, unless a request fails with an auth error.
+
+        :param failed_session: Session a request failed with. Session is
+            only set up again if it has not been refreshed since
+        """
+        async with self._session_lock:
+            if self._session > 0 and failed_session != self._session:
+                return
+            auth_token = self._client.cookies.get("session")
+            self._client.headers.update({
+                "Authorization": f"Token {auth_token}",
+                "X-Consumer-Key": await self.download_consumer_secret()
+            })
+            self.plan = await self.download_plan()
+            logging.debug(f"{self.plan=}")
+            self._session += 1
+
+
+    async def _get(self, url: str, **kwargs) -> httpx.Response:
+        """
+        Get api url. The session is set up again and the request retried
+        once if it fails with an auth error.
+
+        :param url: Url to get
+        :param kwargs: Arguments for `httpx.AsyncClient.get`
+        :returns: Response
+        """
+        await self._setup_session()
+        session = self._session
+        response = await self._client.get(url, **kwargs)
+        if response.status_code in AUTH_ERROR_STATUS_CODES:
+            metrics.observe_retry(response.url.host)
+            await self._setup_session(failed_session = session)
+            response = await self._client.get(url, **kwargs)
+        return response
+
 
     async def download(self, url: str) -> Result:
-        # Set headers
-        auth_token = self._client.cookies.get("session")
-        self._client.headers.update({
-            "Authorization": f"Token {auth_token}",
-            "X-Consumer-Key": await self.download_consumer_secret()
-        })
-        self.plan = await self.download_plan()
-        logging.debug(f"{self.plan=}")
+        await self._setup_session()
         # Download book
         typ, id = self.extract_id_from_url(url)
         if typ == "book":
@@ -43,7 +88,7 @@ class DcUniverseInfinite(Source):
 
     async def download_series(self, series_id: str) -> Series[str]:
         # TODO Check for ultra releases
-        response = await self._client.get(
+        response = await self._get(
             f"https://www.dcuniverseinfinite.com/api/comics/1/series/{series_id}/?trans=en"
         )
         content = response.json()
@@ -54,9 +99,13 @@ class DcUniverseInfinite(Source):
 
 
     async def download_book_from_id(self, book_id: str) -> Book:
+        pages, metadata = await asyncio.gather(
+            self.download_pages(book_id),
+            self.download_book_metadata(book_id)
+        )
         return Book(
-            data = await self.download_pages(book_id),
-            metadata = await self.download_book_metadata(book_id)
+            data = pages,
+            metadata = metadata
         )
 
 
@@ -67,11 +116,11 @@ class DcUniverseInfinite(Source):
         :param book_id: Id of comic
         :return: List of comic pages
         """
-        response = await self._client.get(
+        response = await self._get(
             f"https://www.dcuniverseinfinite.com/api/5/1/rights/comic/{book_id}?trans=en"
         )
         jwt = response.json()
-        response = await self._client.get(
+        response = await self._get(
             "https://www.dcuniverseinfinite.com/api/comics/1/book/download/?page=1&quality=HD&trans=en",
             headers = {
                 "X-Auth-JWT": jwt
@@ -89,6 +138,7 @@ class DcUniverseInfinite(Source):
             images.append(OnlineFile(
                 url = page["signed_url"],
                 extension = "jpg",
+                cache_key = f"{self.name}/{book_id}/{page_number}",
                 encryption = DcUniverseInfiniteEncryption(uuid, page_number, job_id, format_id)
             ))
         return ImageList(images)
@@ -101,7 +151,7 @@ class DcUniverseInfinite(Source):
         :param book_id: Id of book
         :return: Book metadata
         """
-        response = await self._client.get(
+        response = await self._get(
             f"https://www.dcuniverseinfinite.com/api/comics/1/book/{book_id}/?trans=en"
         )
         content = response.json()
@@ -1,7 +1,7 @@
 from grawlix.book import Result, Book, SingleFile, Metadata, OnlineFile
 from grawlix.encryption import AESCTREncryption
 from grawlix.exceptions import InvalidUrl, DataNotFound
-from grawlix.utils import nearest_string, get_arg_from_url
+from grawlix.utils import get_arg_from_url
 from grawlix import logging
 from .source import Source
 
@@ -3,12 +3,18 @@ from grawlix.book import Book, Metadata, ImageList, OnlineFile, Series, Result
 from grawlix.exceptions import InvalidUrl, DataNotFound
 from grawlix.logging import debug
 from grawlix.utils import get_arg_from_url
+from grawlix.utils.singleflight import SingleFlight
 
+import asyncio
 import re
+import time
 from urllib.parse import urlparse
 from typing import Tuple, Optional
 
 BASEURL = "https://reader.flipp.dk/html5/reader"
+# Login info lists every publication with its issues. It is reused for this
+# long, so watched series share a single request but still see new issues
+LOGIN_INFO_MAX_AGE = 15 * 60
 
 LANGUAGE_CODE_MAPPING = {
     "dk": "da-DK",
@@ -23,7 +29,8 @@ class Flipp(Source):
         r"https?://(magasiner|blader).flipp.(dk|no|se)/flipp/web-app/#/publications/.+"
     ]
     _authentication_methods: list[str] = []
-    _login_cache: dict = {}
+    _login_cache: dict[str, Tuple[float, dict]] = {}
+    _login_flights: SingleFlight[dict] = SingleFlight()
 
 
 
@@ -31,7 +38,12 @@ class Flipp(Source):
         domain_extension = self.get_domain_extension(url)
         if re.match(self.match[0], url):
             issue_id = self._extract_issue_id(url)
-            series_id = await self._get_series_id(issue_id)
+            # Login info does not depend on the series id, so it is fetched
+            # (and cached) while the series id is resolved
+            series_id, _ = await asyncio.gather(
+                self._get_series_id(issue_id),
+                self._download_login_info(domain_extension)
+            )
             debug(f"{series_id=}")
             return await self._download_book(issue_id, series_id, domain_extension)
         elif re.match(self.match[1], url):
@@ -72,7 +84,23 @@ class Flipp(Source):
         :returns: Login info
         """
         if language_code in self._login_cache:
-            return self._login_cache[language_code]
+            fetched, login_info = self._login_cache[language_code]
+            if time.monotonic() - fetched < LOGIN_INFO_MAX_AGE:
+                return login_info
+        # The cache is only filled when the response arrives, so concurrent
+        # downloads share the request in flight
+        return await self._login_flights.do(
+            language_code,
+            lambda: self._fetch_login_info(language_code)
+        )
+
+
+    async def _fetch_login_info(self, language_code: str) -> dict:
+        """
+        Download login info from Flipp and store it in cache
+
+        :returns: Login info
+        """
         login_cache = await self._client.post(
             "https://flippapi.egmontservice.com/api/signin",
             headers = {
@@ -89,8 +117,9 @@ class Flipp(Source):
                 "os": ""
             }
         )
-        self._login_cache[language_code] = login_cache.json()
-        return login_cache.json()
+        login_info = login_cache.json()
+        self._login_cache[language_code] = (time.monotonic(), login_info)
+        return login_info
 
 
     def _extract_series_data(self, response: dict, series_id: str) -> dict:
@@ -115,8 +144,10 @@ class Flipp(Source):
         :param series_id: Series identifier
         :returns: Book metadata
         """
-        pages = await self._get_pages(issue_id, series_id)
-        metadata = await self._get_metadata(issue_id, series_id, language_code)
+        pages, metadata = await asyncio.gather(
+            self._get_pages(issue_id, series_id),
+            self._get_metadata(issue_id, series_id, language_code)
+        )
         return Book(
             data = ImageList(pages),
             metadata = Metadata(
@@ -2,11 +2,11 @@ from .source import Source
 from grawlix.encryption import XOrEncryption
 from grawlix.book import Book, Metadata, ImageList, OnlineFile, Series, Result
 from grawlix.exceptions import InvalidUrl
+from grawlix.utils import protobuf
 
+from dataclasses import dataclass
+from typing import Optional
 import re
-import blackboxprotobuf
-import json
-import rich
 
 class MangaPlus(Source):
     name: str = "Manga Plus"
@@ -38,7 +38,7 @@ class MangaPlus(Source):
         :param series_id: Identifier for series
         :returns: Series data
         """
-        response = await self._client.get(
+        response = await self._conditional_get(
             f"https://jumpg-api.tokyo-cdn.com/api/title_detailV2",
             params = {
                 "title_id": series_id,
@@ -49,25 +49,10 @@ class MangaPlus(Source):
                 "secret": "2afb69fbb05f57a1856cf75e1c4b6ee6"
             },
         )
-        data, _ = blackboxprotobuf.protobuf_to_json(response.content)
-        parsed = json.loads(data)
-        title = parsed["1"]["8"]["1"]["2"]
-        issues = []
-        def add_issues(data: dict, main: str):
-            if main in data:
-                x = data[main]
-                if isinstance(x, list):
-                    for i in x:
-                        issues.append(i["2"])
-                else:
-                    issues.append(x["2"])
-        for a in parsed["1"]["8"]["28"]:
-            add_issues(a, "2")
-            add_issues(a, "3")
-            add_issues(a, "4")
+        title_detail = parse_title_detail(response.content)
         return Series(
-            title,
-            book_ids = issues
+            title_detail.title,
+            book_ids = title_detail.chapter_ids
         )
 
     async def _download_issue(self, issue_id: str) -> Book:
@@ -79,24 +64,100 @@ class MangaPlus(Source):
         """
         url = f"https://jumpg-webapi.tokyo-cdn.com/api/manga_viewer?chapter_id={issue_id}&split=yes&img_quality=super_high"
         response = await self._client.get(url)
-        content, _ = blackboxprotobuf.protobuf_to_json(response.content)
-        images = []
-        parsed = json.loads(content)
-        for image in parsed["1"]["10"]["1"]:
-            if "1" in image:
-                images.append(
-                    OnlineFile(
-                        image["1"]["1"],
-                        extension = "jpg",
-                        encryption = XOrEncryption(bytes.fromhex(image["1"]["5"]))
-                    )
-                )
-            elif "3" in image:
-                title = image["3"]["1"]["4"]
+        viewer = parse_manga_viewer(response.content)
+        images = [
+            OnlineFile(
+                page.image_url,
+                extension = "jpg",
+                encryption = XOrEncryption(bytes.fromhex(page.encryption_key)),
+                cache_key = f"{self.name}/{issue_id}/{index}",
+            )
+            for index, page in enumerate(viewer.pages)
+        ]
         return Book(
             data = ImageList(images),
             metadata = Metadata(
-                title,
-                series = parsed["1"]["10"]["5"]
+                viewer.chapter_name or viewer.title_name,
+                series = viewer.title_name
             )
         )
+
+
+# Manga Plus api responses are protobuf messages. Only the fields used by
+# grawlix are decoded:
+#
+# Response { 1: SuccessResult }
+# SuccessResult { 8: TitleDetailView, 10: MangaViewer }
+# TitleDetailView { 1: Title, 28: repeated ChapterListGroup }
+# Title { 2: string name }
+# ChapterListGroup { 2, 3, 4: repeated Chapter (first, mid and last chapters) }
+# Chapter { 2: uint32 chapter_id }
+# MangaViewer { 1: repeated Page, 5: string title_name }
+# Page { 1: MangaPage, 3: LastPage }
+# MangaPage { 1: string image_url, 5: string encryption_key }
+# LastPage { 1: Chapter current_chapter }, where Chapter { 4: string name }
+
+@dataclass(slots=True)
+class TitleDetail:
+    title: str
+    chapter_ids: list[int]
+
+
+@dataclass(slots=True)
+class MangaPage:
+    image_url: str
+    encryption_key: str
+
+
+@dataclass(slots=True)
+class MangaViewer:
+    title_name: str
+    pages: list[MangaPage]
+    chapter_name: Optional[str] = None
+
+
+def parse_title_detail(content: bytes) -> TitleDetail:
+    """
+    Decode response from title detail endpoint
+
+    :param content: Response body
+    :returns: Title and chapter ids in series
+    """
+    success = protobuf.get_message(protobuf.parse_message(content), 1)
+    title_detail_view = protobuf.get_message(success, 8)
+    title = protobuf.get_message(title_detail_view, 1)
+    chapter_ids = []
+    for group in protobuf.get_messages(title_detail_view, 28):
+        for chapter_list in (2, 3, 4):
+            for chapter in protobuf.get_messages(group, chapter_list):
+                chapter_ids.append(protobuf.get_int(chapter, 2))
+    return TitleDetail(
+        title = protobuf.get_string(title, 2),
+        chapter_ids = chapter_ids,
+    )
+
+
+def parse_manga_viewer(content: bytes) -> MangaViewer:
+    """
+    Decode response from manga viewer endpoint
+
+    :param content: Response body
+    :returns: Pages and names of chapter
+    """
+    success = protobuf.get_message(protobuf.parse_message(content), 1)
+    viewer = protobuf.get_message(success, 10)
+    result = MangaViewer(
+        title_name = protobuf.get_string(viewer, 5),
+        pages = [],
+    )
+    for page in protobuf.get_messages(viewer, 1):
+        if 1 in page:
+            manga_page = protobuf.get_message(page, 1)
+            result.pages.append(MangaPage(
+                image_url = protobuf.get_string(manga_page, 1),
+                encryption_key = protobuf.get_string(manga_page, 5),
+            ))
+        elif 3 in page:
+            current_chapter = protobuf.get_message(protobuf.get_message(page, 3), 1)
+            result.chapter_name = protobuf.get_string(current_chapter, 4)
+    return result
@@ -1,9 +1,11 @@
 from grawlix.book import Book, Metadata, ImageList, OnlineFile, Series, Result
 from grawlix.exceptions import InvalidUrl, DataNotFound
 from grawlix import logging
+from grawlix.utils.singleflight import SingleFlight
 
 from .source import Source
 
+import asyncio
 import re
 from datetime import date
 
@@ -19,6 +21,10 @@ class Marvel(Source[str]):
     ]
     _authentication_methods: list[str] = [ "cookies" ]
 
+    def __init__(self):
+        super().__init__()
+        self._series_metadata: SingleFlight[dict] = SingleFlight()
+
 
     async def download(self, url: str) -> Result[str]:
         match_index = self.get_match_index(url)
@@ -41,8 +47,10 @@ class Marvel(Source[str]):
         :returns: Series data
         """
         series_id = url.split("/")[-2]
-        issue_ids = await self._download_issue_ids(series_id)
-        metadata = await self._download_series_metadata(series_id)
+        issue_ids, metadata = await asyncio.gather(
+            self._download_issue_ids(series_id),
+            self._download_series_metadata(series_id)
+        )
         return Series(
             title = metadata["data"]["results"][0]["title"],
             book_ids = issue_ids
@@ -56,7 +64,7 @@ class Marvel(Source[str]):
         :param series_id: Id of comic series on marvel.com
         :returns: List of comic ids for marvel comics
         """
-        response = await self._client.get(
+        response = await self._conditional_get(
             f"https://bifrost.marvel.com/v1/catalog/comics/mu?byId={series_id}&byZone=marvel_site_zone&byType=comic_series&orderBy=release_date+desc&formatType=issue,digitalcomic,collection,digitalverticalcomic&limit=10000&offset=0&variants=false"
         )
         issue_ids = [issue["digital_id"] for issue in response.json()["data"]["results"]]
@@ -70,13 +78,16 @@ class Marvel(Source[str]):
         :param series_id: Id of comic series on marvel.com
         :returns: Dictionary with metadata
         """
-        response = await self._client.get(
-            f"https://gateway.marvel.com:443/v1/public/series/{series_id}?apikey={API_KEY}",
-            headers = {
-                "Referer": "https://developer.marvel.com/"
-            }
-        )
-        return response.json()
+        async def download() -> dict:
+            response = await self._client.get(
+                f"https://gateway.marvel.com:443/v1/public/series/{series_id}?apikey={API_KEY}",
+                headers = {
+                    "Referer": "https://developer.marvel.com/"
+                }
+            )
+            return response.json()
+        # Series downloaded at the same time share the request
+        return await self._series_metadata.do(series_id, download)
 
     async def _get_issue_id(self, url: str) -> str:
         """
@@ -94,9 +105,13 @@ class Marvel(Source[str]):
 
 
     async def download_book_from_id(self, issue_id: str) -> Book:
+        metadata, pages = await asyncio.gather(
+            self._download_issue_metadata(issue_id),
+            self._download_issue_pages(issue_id)
+        )
         return Book(
-            metadata = await self._download_issue_metadata(issue_id),
-            data = await self._download_issue_pages(issue_id)
+            metadata = metadata,
+            data = pages
         )
 
 
@@ -206,12 +206,13 @@ class Nextory(Source):
             iv = self._fix_key(epub_data["crypt_iv"])
         )
         files = []
-        for part in epub_data["spines"]:
+        for index, part in enumerate(epub_data["spines"]):
             files.append(
                 OnlineFile(
                     url = part["spine_url"],
                     extension = "epub",
-                    encryption = encryption
+                    encryption = encryption,
+                    cache_key = f"{self.name}/{epub_id}/{index}",
                 )
             )
         files_in_toc = {}
@@ -50,7 +50,8 @@ class Saxo(Source):
                     encryption = AESEncryption(
                         key = b"CD3E9D141D8EFC0886912E7A8F3652C4",
                         iv = b"78CB354D377772F1"
-                    )
+                    ),
+                    cache_key = f"{self.name}/{ebook_id}",
                 )
             )
         )
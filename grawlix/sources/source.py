@@ -1,4 +1,5 @@
 from grawlix.book import Book, Series, Result
+from grawlix.network import create_client
 
 from typing import Generic, TypeVar, Tuple, Optional
 from http.cookiejar import MozillaCookieJar
@@ -8,6 +9,11 @@ import httpx
 
 T = TypeVar("T")
 
+
+class NotModified(Exception):
+    """Raised by `Source._conditional_get` when a listing has not changed"""
+
+
 class Source(Generic[T]):
     """
     General class for downloading books from various sources
@@ -19,7 +25,10 @@ class Source(Generic[T]):
     authenticated = False
 
     def __init__(self):
-        self._client = httpx.AsyncClient()
+        self._client = create_client()
+        # ETag and Last-Modified of responses by request url. Only set when
+        # series are watched, so regular downloads never see a 304
+        self.validators: Optional[dict[str, dict[str, str]]] = None
 
 
     @property
@@ -95,3 +104,38 @@ class Source(Generic[T]):
             if re.match(match, url):
                 return index
         return None
+
+
+    async def _conditional_get(self, url: str, follow_redirects: bool = False, **kwargs) -> httpx.Response:
+        """
+        Get listing with a conditional request if validators from an earlier
+        response are known
+
+        :param url: Url to get
+        :param follow_redirects: Follow redirects
+        :param kwargs: Arguments for `httpx.AsyncClient.build_request`
+        :returns: Response
+        :raises NotModified: If content has not changed since last request
+        """
+        request = self._client.build_request("GET", url, **kwargs)
+        key = str(request.url)
+        if self.validators is not None and key in self.validators:
+            validators = self.validators[key]
+            if "etag" in validators:
+                request.headers["If-None-Match"] = validators["etag"]
+            if "last-modified" in validators:
+                request.headers["If-Modified-Since"] = validators["last-modified"]
+        response = await self._client.send(request, follow_redirects = follow_redirects)
+        if response.status_code == 304:
+            raise NotModified
+        if self.validators is not None and response.is_success:
+            validators = {
+                name: response.headers[name]
+                for name in ("etag", "last-modified")
+                if name in response.headers
+            }
+            if validators:
+                self.validators[key] = validators
+            else:
+                self.validators.pop(key, None)
+        return response
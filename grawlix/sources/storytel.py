@@ -3,6 +3,7 @@ from grawlix.exceptions import SourceNotAuthenticated, InvalidUrl, DataNotFound
 from grawlix import logging
 from .source import Source
 
+import asyncio
 import json
 import re
 from urllib3.util import parse_url
@@ -36,18 +37,18 @@ class Storytel(Source):
 
 
     async def download_book_from_id(self, book_id: str) -> Book:
-        # Epub location
-        response = await self._client.get(
-            f"https://api.storytel.net/assets/v2/consumables/{book_id}/ebook",
+        # Epub location and book details
+        location_response, details_response = await asyncio.gather(
+            self._client.get(
+                f"https://api.storytel.net/assets/v2/consumables/{book_id}/ebook",
+            ),
+            self._client.get(
+                f"https://api.storytel.net/book-details/consumables/{book_id}?kidsMode=false&configVariant=default"
+            )
         )
         self.__download_counter += 1
-        epub_url = response.headers["Location"]
-
-        # Book details
-        response = await self._client.get(
-            f"https://api.storytel.net/book-details/consumables/{book_id}?kidsMode=false&configVariant=default"
-        )
-        details = response.json()
+        epub_url = location_response.headers["Location"]
+        details = details_response.json()
 
         return Book(
             metadata = Metadata(
@@ -57,7 +58,8 @@ class Storytel(Source):
                 OnlineFile(
                     url = epub_url,
                     extension = "epub",
-                    headers = self._client.headers
+                    headers = self._client.headers,
+                    cache_key = f"{self.name}/{book_id}",
                 )
             )
         )
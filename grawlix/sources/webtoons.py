@@ -1,14 +1,48 @@
 from .source import Source
 from grawlix.book import Book, Metadata, ImageList, OnlineFile, Series, Result
 from grawlix.utils import get_arg_from_url
-from grawlix.exceptions import InvalidUrl
+from grawlix.exceptions import InvalidUrl, DataNotFound
 
 from bs4 import BeautifulSoup
+import asyncio
+import html
+import math
 import re
 from urllib.parse import urlparse
 
 USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:111.0) Gecko/20100101 Firefox/111.0"
-MOBILE_USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 14_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0.3 Mobile/15E148 Safari/604.1"
+
+LIST_COOKIES = {
+    "needGDPR": "FALSE",
+    "needCCPA": "FALSE",
+    "needCOPPA": "FALSE"
+}
+MAX_CONCURRENT_PAGES = 4
+
+# Listing pages are only searched for these patterns, which is a lot faster
+# than parsing every page
+EPISODE = re.compile(r'<li[^>]*\bdata-episode-no="(\d+)"[^>]*>.*?<a[^>]*\bhref="([^"]+)"', re.DOTALL)
+PAGE_LINK = re.compile(r'href="[^"]*[?&](?:amp;)?page=(\d+)')
+TITLE = re.compile(r'<meta[^>]*property="og:title"[^>]*content="([^"]*)"')
+
+
+def extract_episodes(content: str) -> dict[int, str]:
+    """
+    Find episodes in listing page
+
+    :param content: Html of listing page
+    :returns: Urls of episodes by episode number
+    """
+    return {
+        int(number): html.unescape(link)
+        for number, link in EPISODE.findall(content)
+    }
+
+
+def extract_page_numbers(content: str) -> set[int]:
+    """Find numbers of listing pages linked from listing page"""
+    return { int(page) for page in PAGE_LINK.findall(content) }
+
 
 class Webtoons(Source[str]):
 
@@ -33,34 +67,73 @@ class Webtoons(Source[str]):
 
     async def _download_series(self, url: str) -> Series[str]:
         """
-        Download a series of webtoons
+        Download a series of webtoons. The episode list is split into pages,
+        which are downloaded concurrently after the first one.
 
         :param url: Url of series
         :returns: Webtoons series data
         """
         parsed_url = urlparse(url)
-        response = await self._client.get(
-            f"https://m.webtoons.com{parsed_url.path}",
-            params = parsed_url.query,
-            headers = {
-                "User-Agent": MOBILE_USER_AGENT,
-            },
-            cookies = {
-                "needGDPR": "FALSE",
-                "needCCPA": "FALSE",
-                "needCOPPA": "FALSE"
-            },
+        list_url = f"https://www.webtoons.com{parsed_url.path}"
+        title_no = get_arg_from_url(url, "title_no")
+        # Conditional, so watching the series stops here when nothing changed
+        response = await self._conditional_get(
+            list_url,
+            params = { "title_no": title_no },
+            headers = { "User-Agent": USER_AGENT },
+            cookies = LIST_COOKIES,
             follow_redirects = True,
         )
-        soup = BeautifulSoup(response.text, "lxml")
-        title = soup.find("meta", property="og:title").get("content")
-        episodes = []
-        for episode in soup.find_all("li", class_="_episodeItem"):
-            episode_link = episode.find("a").get("href")
-            episodes.append(episode_link)
+        first_page = response.text
+        title_match = TITLE.search(first_page)
+        if title_match is None:
+            raise DataNotFound
+        title = html.unescape(title_match.group(1))
+        episodes = extract_episodes(first_page)
+        if not episodes:
+            raise DataNotFound
+        # Pages are listed in groups of 10, so the page count is estimated
+        # from the number of the newest episode. Deleted episodes make the
+        # estimate too high, which can request pages past the end.
+        per_page = len(episodes)
+        last_page = max(
+            max(extract_page_numbers(first_page), default = 1),
+            math.ceil(max(episodes) / per_page),
+        )
+        downloaded = { 1 }
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_PAGES)
+
+        async def download_page(page: int) -> str:
+            async with semaphore:
+                response = await self._client.get(
+                    list_url,
+                    params = { "title_no": title_no, "page": page },
+                    headers = { "User-Agent": USER_AGENT },
+                    cookies = LIST_COOKIES,
+                    follow_redirects = True,
+                )
+            # Pages past the end redirect to another page, which is
+            # downloaded on its own if it exists
+            if response.url.params.get("page") != str(page):
+                return ""
+            return response.text
+
+        pages = [ page for page in range(2, last_page + 1) ]
+        while pages:
+            downloaded.update(pages)
+            contents = await asyncio.gather(*[download_page(page) for page in pages])
+            # Episodes that are not numbered contiguously make the estimate
+            # too low, in which case the pagination of the downloaded pages
+            # links to more pages. Episodes on several pages are merged by
+            # episode number.
+            new_pages: set[int] = set()
+            for content in contents:
+                episodes.update(extract_episodes(content))
+                new_pages.update(extract_page_numbers(content))
+            pages = sorted(new_pages - downloaded)
         return Series(
             title,
-            book_ids = episodes
+            book_ids = [ episodes[number] for number in sorted(episodes) ]
         )
 
 
@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+from typing import Iterator, Any
+import asyncio
+import json
+import os
+import threading
+import time
+
+# Tracing is disabled unless `enable` is called
+enabled = False
+_events: list[dict[str, Any]] = []
+# Maps asyncio tasks and threads to small ids shown as rows in trace viewers
+_thread_ids: dict[int, int] = {}
+
+
+def enable() -> None:
+    """Start recording spans"""
+    global enabled
+    enabled = True
+
+
+def _timestamp(seconds: float) -> float:
+    """Convert `time.perf_counter` value to microseconds used in trace events"""
+    return seconds * 1_000_000
+
+
+def _current_thread_id() -> int:
+    """
+    Find id of the row the current span belongs to. Each asyncio task gets its
+    own row, so concurrent downloads are shown next to each other.
+
+    :returns: Small integer identifying the current task or thread
+    """
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        key, name = id(task), task.get_name()
+    else:
+        key, name = threading.get_ident(), threading.current_thread().name
+    if key not in _thread_ids:
+        _thread_ids[key] = len(_thread_ids) + 1
+        _events.append({
+            "name": "thread_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "tid": _thread_ids[key],
+            "args": { "name": name },
+        })
+    return _thread_ids[key]
+
+
+def add_span(name: str, category: str, start: float, end: float, **args: Any) -> None:
+    """
+    Record span that has already finished
+
+    :param name: Name of span
+    :param category: Category of span
+    :param start: Start of span from `time.perf_counter`
+    :param end: End of span from `time.perf_counter`
+    :param args: Extra information shown with span
+    """
+    if not enabled:
+        return
+    _events.append({
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": _timestamp(start),
+        "dur": _timestamp(end - start),
+        "pid": os.getpid(),
+        "tid": _current_thread_id(),
+        "args": args,
+    })
+
+
+@contextmanager
+def span(name: str, category: str = "grawlix", **args: Any) -> Iterator[None]:
+    """
+    Record time spent inside block as a span
+
+    :param name: Name of span
+    :param category: Category of span
+    :param args: Extra information shown with span
+    """
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, category, start, time.perf_counter(), **args)
+
+
+def events() -> list[dict[str, Any]]:
+    """Recorded trace events"""
+    return _events
+
+
+def add_events(events: list[dict[str, Any]]) -> None:
+    """
+    Add trace events recorded by another process (ex. a batch worker). Events
+    keep the process id they were recorded with, so every process is shown
+    separately.
+
+    :param events: Events from `events`
+    """
+    _events.extend(events)
+
+
+def write(location: str) -> None:
+    """
+    Write recorded spans to disk in the Chrome trace event format
+
+    :param location: Path to output file
+    """
+    with open(location, "w") as f:
+        json.dump({ "traceEvents": _events, "displayTimeUnit": "ms" }, f)
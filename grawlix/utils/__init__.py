@@ -1,7 +1,7 @@
 from grawlix.exceptions import DataNotFound
 
 from urllib.parse import urlparse, parse_qs
-from functools import lru_cache
+from typing import Iterable, Optional
 import importlib.resources
 
 def get_arg_from_url(url: str, key: str) -> str:
@@ -13,32 +13,119 @@ def get_arg_from_url(url: str, key: str) -> str:
         raise DataNotFound
 
 
-@lru_cache
-def levenstein_distance(a: str, b: str) -> int:
+def levenstein_distance(a: str, b: str, max_distance: Optional[int] = None) -> int:
     """
-    Calculates the levenstein distance between `a` and `b`
+    Calculates the levenstein distance between `a` and `b` with the
+    bit-parallel algorithm by Myers (as formulated by Hyyrö)
 
     https://en.wikipedia.org/wiki/Levenshtein_distance
+
+    :param max_distance: Stop early if distance is larger than this
+    :returns: Distance between `a` and `b` or `max_distance + 1` if the
+        distance is larger than `max_distance`
     """
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # Pattern is stored as a bit vector, so the shortest string is used
+    if len(a) > len(b):
+        a, b = b, a
     if len(a) == 0:
         return len(b)
-    if len(b) == 0:
-        return len(a)
-    if a[0] == b[0]:
-        return levenstein_distance(a[1:], b[1:])
-    return 1 + min(
-        levenstein_distance(a, b[1:]), # Character is inserted
-        levenstein_distance(a[1:], b), # Character is deleted
-        levenstein_distance(a[1:], b[1:]) # Character is replaced
-    )
+    pattern_equal: dict[str, int] = {}
+    for index, char in enumerate(a):
+        pattern_equal[char] = pattern_equal.get(char, 0) | (1 << index)
+    mask = (1 << len(a)) - 1
+    last_bit = 1 << (len(a) - 1)
+    positive_vertical = mask
+    negative_vertical = 0
+    score = len(a)
+    remaining = len(b)
+    for char in b:
+        equal = pattern_equal.get(char, 0)
+        vertical = equal | negative_vertical
+        horizontal = (((equal & positive_vertical) + positive_vertical) ^ positive_vertical) | equal
+        positive_horizontal = negative_vertical | ~(horizontal | positive_vertical)
+        negative_horizontal = positive_vertical & horizontal
+        if positive_horizontal & last_bit:
+            score += 1
+        elif negative_horizontal & last_bit:
+            score -= 1
+        remaining -= 1
+        # Score can at most decrease by one for each remaining character
+        if max_distance is not None and score - remaining > max_distance:
+            return max_distance + 1
+        positive_horizontal = (positive_horizontal << 1) | 1
+        negative_horizontal = negative_horizontal << 1
+        positive_vertical = (negative_horizontal | ~(vertical | positive_horizontal)) & mask
+        negative_vertical = positive_horizontal & vertical & mask
+    return score
+
+
+def nearest_string(input: str, list: Iterable[str]) -> str:
+    """
+    Finds the nearest string in `list` to `input` based on levenstein distance.
+    The first string is returned if multiple strings have the same distance.
+    """
+    best: Optional[str] = None
+    best_distance: Optional[int] = None
+    for candidate in list:
+        if best_distance is None:
+            distance = levenstein_distance(input, candidate)
+        else:
+            # Only strings closer than the current best are interesting
+            distance = levenstein_distance(input, candidate, best_distance - 1)
+        if best_distance is None or distance < best_distance:
+            best, best_distance = candidate, distance
+            if distance == 0:
+                break
+    if best is None:
+        raise ValueError("No strings to compare with")
+    return best
+
 
+SIZE_SUFFIXES = {
+    "": 1,
+    "K": 1024,
+    "M": 1024**2,
+    "G": 1024**3,
+}
 
+def parse_size(value: str) -> int:
+    """
+    Parse size given by user. Accepts plain numbers of bytes or numbers followed
+    by K, M or G (multiples of 1024).
+
+    :param value: Size as string (ex. "512M")
+    :returns: Size in bytes
+    :raises ValueError: If value is not a valid size
+    """
+    value = value.strip().upper().removesuffix("B")
+    suffix = value[-1:] if value[-1:] in SIZE_SUFFIXES else ""
+    number = value[:len(value)-len(suffix)]
+    return int(float(number) * SIZE_SUFFIXES[suffix])
 
-def nearest_string(input: str, list: list[str]) -> str:
+
+DURATION_SUFFIXES = {
+    "": 1,
+    "S": 1,
+    "M": 60,
+    "H": 60*60,
+    "D": 24*60*60,
+}
+
+def parse_duration(value: str) -> float:
     """
-    Finds the nearest string in `list` to `input` based on levenstein distance
+    Parse duration given by user. Accepts plain numbers of seconds or numbers
+    followed by s, m, h or d.
+
+    :param value: Duration as string (ex. "6h")
+    :returns: Duration in seconds
+    :raises ValueError: If value is not a valid duration
     """
-    return sorted(list, key = lambda x: levenstein_distance(input, x))[0]
+    value = value.strip().upper()
+    suffix = value[-1:] if value[-1:] in DURATION_SUFFIXES else ""
+    number = value[:len(value)-len(suffix)]
+    return float(number) * DURATION_SUFFIXES[suffix]
 
 
 def read_asset_file(path: str) -> str:
@@ -0,0 +1,132 @@
+"""
+Minimal reader for the protobuf wire format
+
+Only decodes the structure of a message. Interpreting fields is left to the
+caller, who knows the schema of the message.
+https://protobuf.dev/programming-guides/encoding/
+"""
+from grawlix.exceptions import DataNotFound
+
+from typing import Union
+
+Buffer = Union[bytes, memoryview]
+Value = Union[int, memoryview]
+
+VARINT = 0
+I64 = 1
+LEN = 2
+I32 = 5
+
+
+def read_varint(data: Buffer, position: int) -> tuple[int, int]:
+    """
+    Read variable length integer
+
+    :param data: Message to read from
+    :param position: Position of first byte of integer
+    :returns: Value of integer and position after it
+    """
+    result = 0
+    shift = 0
+    while True:
+        try:
+            byte = data[position]
+        except IndexError:
+            raise DataNotFound
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def parse_message(data: Buffer) -> dict[int, list[Value]]:
+    """
+    Split message into fields. Nested messages, strings and bytes are returned
+    as memoryviews into `data` without being copied or decoded.
+
+    :param data: Encoded message
+    :returns: Values of every field by field number, in order of appearance
+    """
+    view = memoryview(data)
+    length = len(view)
+    fields: dict[int, list[Value]] = {}
+    position = 0
+    while position < length:
+        key, position = read_varint(view, position)
+        field_number, wire_type = key >> 3, key & 0x7
+        value: Value
+        if wire_type == VARINT:
+            value, position = read_varint(view, position)
+        elif wire_type == LEN:
+            size, position = read_varint(view, position)
+            value = view[position:position+size]
+            position += size
+        elif wire_type == I64:
+            value = view[position:position+8]
+            position += 8
+        elif wire_type == I32:
+            value = view[position:position+4]
+            position += 4
+        else:
+            raise DataNotFound
+        if position > length:
+            raise DataNotFound
+        fields.setdefault(field_number, []).append(value)
+    return fields
+
+
+def get_message(fields: dict[int, list[Value]], field_number: int) -> dict[int, list[Value]]:
+    """
+    Parse nested message. Uses the last occurrence if field is repeated.
+
+    :param fields: Parsed parent message
+    :param field_number: Field number of nested message
+    :returns: Fields of nested message
+    :raises DataNotFound: If field does not exist
+    """
+    return parse_message(get_bytes(fields, field_number))
+
+
+def get_messages(fields: dict[int, list[Value]], field_number: int) -> list[dict[int, list[Value]]]:
+    """
+    Parse every occurrence of repeated nested message
+
+    :param fields: Parsed parent message
+    :param field_number: Field number of nested messages
+    :returns: Fields of each nested message (empty if field does not exist)
+    """
+    return [parse_message(value) for value in fields.get(field_number, []) if isinstance(value, memoryview)]
+
+
+def get_bytes(fields: dict[int, list[Value]], field_number: int) -> memoryview:
+    """
+    Read length delimited field
+
+    :raises DataNotFound: If field does not exist
+    """
+    values = fields.get(field_number)
+    if not values or not isinstance(values[-1], memoryview):
+        raise DataNotFound
+    return values[-1]
+
+
+def get_string(fields: dict[int, list[Value]], field_number: int) -> str:
+    """
+    Read string field
+
+    :raises DataNotFound: If field does not exist
+    """
+    return str(get_bytes(fields, field_number), "utf8")
+
+
+def get_int(fields: dict[int, list[Value]], field_number: int) -> int:
+    """
+    Read varint field
+
+    :raises DataNotFound: If field does not exist
+    """
+    values = fields.get(field_number)
+    if not values or not isinstance(values[-1], int):
+        raise DataNotFound
+    return values[-1]
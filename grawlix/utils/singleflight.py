@@ -0,0 +1,66 @@
+"""
+Coalescing of identical concurrent calls
+
+When several tasks ask for the same resource at the same time, only the first
+one runs the call. The others wait for its result instead of sending the same
+request again. Nothing is kept after the call finishes, so later calls run
+again.
+"""
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Runs at most one call per key at a time"""
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future[T]] = {}
+        # Number of tasks waiting for each call
+        self._waiters: dict[asyncio.Future[T], int] = {}
+
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Is a call with key in flight"""
+        return key in self._calls
+
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `function` unless a call with the same key is already running, in
+        which case its result (or exception) is shared. The call is cancelled
+        when every task waiting for it is cancelled.
+
+        :param key: Identity of call
+        :param function: Creates the call
+        :returns: Result of call
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(function())
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._forget(key, call))
+        self._waiters[call] = self._waiters.get(call, 0) + 1
+        try:
+            # Shielded, so one waiting task being cancelled does not cancel
+            # the call for the others
+            return await asyncio.shield(call)
+        finally:
+            self._waiters[call] -= 1
+            if self._waiters[call] == 0:
+                del self._waiters[call]
+                if not call.done():
+                    # Nobody wants the result anymore. Later calls with the
+                    # same key start over instead of joining the cancelled one
+                    self._forget(key, call)
+                    call.cancel()
+
+
+    def _forget(self, key: Hashable, call: asyncio.Future[T]) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Retrieve exception of calls nobody waits for anymore, so it is not
+        # logged as never retrieved
+        if call.done() and not call.cancelled():
+            call.exception()
@@ -0,0 +1,253 @@
+"""
+Watch series for new books
+
+Known book ids of every watched series are stored in a state file. Each poll
+only downloads the listing of the series (with a conditional request if the
+source supports it), and books are only downloaded for ids not seen before.
+Polls are spread evenly over the interval, so watching many series does not
+result in bursts of requests.
+"""
+from grawlix.book import Book, Series
+from grawlix.exceptions import GrawlixError, AccessDenied, InvalidUrl
+from grawlix.output import download_book
+from grawlix.output.staging import write_file_atomic
+from grawlix.sources import load_source, Source
+from grawlix.sources.source import NotModified
+from grawlix import catalog, logging, metrics, tracing
+
+from dataclasses import dataclass, field, asdict
+from functools import partial
+from typing import Any, Optional
+import appdirs
+import asyncio
+import heapq
+import httpx
+import json
+import os
+import random
+import time
+import traceback
+
+# Fraction of interval polls are moved randomly, so series added at the same
+# time drift apart
+JITTER = 0.1
+
+
+@dataclass(slots=True)
+class WatchedSeries:
+    url: str
+    title: Optional[str] = None
+    # Ids of books downloaded (or skipped because access was denied)
+    known: list[Any] = field(default_factory=list)
+    # Ids of books found in listing but not downloaded yet
+    pending: list[Any] = field(default_factory=list)
+    # Unix time of last poll
+    checked: Optional[float] = None
+
+
+def book_id_key(book_id: Any) -> str:
+    """
+    Comparable representation of book id. Ids are stored as json, so tuples
+    are read back as lists.
+    """
+    return json.dumps(book_id)
+
+
+class WatchState:
+    """Watched series and validators of their listings stored on disk"""
+
+    def __init__(self, location: str):
+        """
+        :param location: Path of state file
+        """
+        self.location = location
+        self.series: dict[str, WatchedSeries] = {}
+        # Validators of listing responses by source name
+        self.validators: dict[str, dict[str, dict[str, str]]] = {}
+        if os.path.exists(location):
+            with open(location, "r") as f:
+                data = json.load(f)
+            for values in data.get("series", []):
+                series = WatchedSeries(**values)
+                self.series[series.url] = series
+            self.validators = data.get("validators", {})
+
+
+    def add(self, url: str) -> WatchedSeries:
+        """
+        Start watching series
+
+        :param url: Url of series
+        :returns: State of series
+        """
+        if url not in self.series:
+            self.series[url] = WatchedSeries(url)
+        return self.series[url]
+
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.location)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        data = {
+            "series": [asdict(series) for series in self.series.values()],
+            "validators": self.validators,
+        }
+        write_file_atomic(self.location, json.dumps(data, indent = 2).encode("utf8"))
+
+
+def default_state_location() -> str:
+    return os.path.join(appdirs.user_data_dir("grawlix", "jo1gi"), "watch.json")
+
+
+class Watcher:
+    """Polls watched series and downloads new books"""
+
+    def __init__(self, state: WatchState, template: Optional[str], baseline: bool):
+        """
+        :param state: State of watched series
+        :param template: Output template
+        :param baseline: Mark books in newly added series as known instead of
+            downloading them
+        """
+        self.state = state
+        self.template = template or "{series}/{title}.{ext}"
+        self.baseline = baseline
+        self._queue: asyncio.Queue[tuple[Source, WatchedSeries]] = asyncio.Queue()
+        self._queued: set[str] = set()
+
+
+    async def run(self, urls: list[str], interval: float, once: bool) -> None:
+        """
+        Poll series until cancelled
+
+        :param urls: Urls of series to watch
+        :param interval: Seconds between polls of each series
+        :param once: Poll every series once and stop when new books are downloaded
+        """
+        if not urls:
+            return
+        now = time.time()
+        heap = []
+        for index, url in enumerate(urls):
+            checked = self.state.add(url).checked
+            due = checked + interval if checked and not once else now
+            heap.append((max(due, now), index, url))
+        heapq.heapify(heap)
+        # Polls are never closer than this, which spreads them evenly over
+        # the interval
+        gap = 0 if once else interval / len(urls)
+        last_poll = 0.
+        worker = asyncio.create_task(self._download_worker())
+        try:
+            while heap:
+                due, index, url = heapq.heappop(heap)
+                await asyncio.sleep(max(due, last_poll + gap) - time.time())
+                last_poll = time.time()
+                await self.poll(self.state.series[url])
+                if not once:
+                    jitter = random.uniform(-JITTER, JITTER) * interval
+                    heapq.heappush(heap, (last_poll + interval + jitter, index, url))
+            await self._queue.join()
+        finally:
+            worker.cancel()
+
+
+    async def poll(self, series: WatchedSeries) -> None:
+        """
+        Download listing of series and queue new books for download
+
+        :param series: Series to poll
+        """
+        try:
+            source: Source = load_source(series.url)
+            source.validators = self.state.validators.setdefault(source.name, {})
+            with metrics.phase("metadata"), tracing.span(series.url, "poll"):
+                result = await source.download(series.url)
+            if not isinstance(result, Series):
+                raise InvalidUrl
+            self._update_series(series, result)
+        except NotModified:
+            logging.debug(f"{series.url} has not changed")
+        except (GrawlixError, httpx.HTTPError) as error:
+            logging.info(f"[red]Failed to check {series.url}[/] ({type(error).__name__})")
+            return
+        except Exception as error:
+            # Ex. a source whose api changed. Other series are still polled
+            logging.info(f"[red]Failed to check {series.url}[/] ({type(error).__name__})")
+            if logging.debug_mode:
+                traceback.print_exc()
+            return
+        series.checked = time.time()
+        self.state.save()
+        if series.pending and series.url not in self._queued:
+            self._queued.add(series.url)
+            self._queue.put_nowait((source, series))
+
+
+    def _update_series(self, series: WatchedSeries, result: Series) -> None:
+        """Add ids in listing not seen before to pending books"""
+        series.title = result.title
+        seen = {
+            book_id_key(book_id)
+            for book_id in series.known + series.pending
+        }
+        new = [book_id for book_id in result.book_ids if book_id_key(book_id) not in seen]
+        if series.checked is None and not series.known and self.baseline:
+            series.known.extend(new)
+            return
+        if new:
+            logging.info(f"Found [yellow not bold]{len(new)}[/] new books in [blue]{result.title}[/]")
+        series.pending.extend(new)
+
+
+    async def _download_worker(self) -> None:
+        while True:
+            source, series = await self._queue.get()
+            try:
+                await self._download_pending(source, series)
+            except Exception as error:
+                # The worker is the only download task, so it has to survive
+                # anything a single series throws
+                logging.info(f"[red]Failed to download books in {series.title or series.url}[/] ({type(error).__name__})")
+                if logging.debug_mode:
+                    traceback.print_exc()
+            finally:
+                self._queued.discard(series.url)
+                self._queue.task_done()
+
+
+    async def _download_pending(self, source: Source, series: WatchedSeries) -> None:
+        """
+        Download pending books in series. Books that fail stay pending and
+        are retried after the next poll.
+        """
+        title = series.title or series.url
+        with logging.progress(title, source.name, len(series.pending)) as progress:
+            for book_id in list(series.pending):
+                try:
+                    with metrics.phase("metadata"):
+                        book: Book = await source.download_book_from_id(book_id)
+                    task = logging.add_book(progress, book)
+                    with tracing.span(book.metadata.title, "book"):
+                        await download_book(
+                            book,
+                            partial(progress.advance, task),
+                            self.template,
+                            source = source.name,
+                            book_id = catalog.id_key(book_id),
+                        )
+                    progress.advance(task, 1)
+                except AccessDenied:
+                    logging.info("Skipping - Access Denied")
+                except (GrawlixError, httpx.HTTPError) as error:
+                    logging.info(f"[red]Failed to download {book_id}[/] ({type(error).__name__})")
+                    continue
+                except Exception as error:
+                    logging.info(f"[red]Failed to download {book_id}[/] ({type(error).__name__})")
+                    if logging.debug_mode:
+                        traceback.print_exc()
+                    continue
+                series.pending.remove(book_id)
+                series.known.append(book_id)
+                self.state.save()